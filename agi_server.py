@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+FastAGI сервер поиска реального номера для Asterisk.
+
+Диалплан вызывает AGI(agi://host:4573/lookup,${EXTEN}), сервер отвечает
+из индекса fake -> real в памяти и выставляет каналу переменные
+REAL_PHONE и LOOKUP_STATUS (FOUND / NOTFOUND / ERROR). Индекс перечитывается
+из MySQL при смене поколения маппингов, звонки логируются в фоне.
+
+    python agi_server.py                        # сервер на AGI_HOST:AGI_PORT
+    python agi_server.py client 700000000000001 # тестовый AGI-клиент
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+from app.call_log import CallLogWriter
+from app.mapping_index import MappingIndex
+from app.models import Database
+from app.utils import normalize_phone
+from config import Config
+
+
+BASE_DIR = Path(__file__).resolve().parent
+LOG_DIR = BASE_DIR / "logs"
+LOG_FILE = LOG_DIR / "agi.log"
+
+logger = logging.getLogger("agi_server")
+
+
+def setup_logging():
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+
+
+class FakeToRealIndex:
+    """
+    Все связки fake -> real в памяти процесса (компактный MappingIndex).
+
+    reload() строит новый индекс потоковым чтением таблицы и подменяет
+    ссылку целиком, поэтому поиск не блокируется на время загрузки.
+    is_stale() запоминает последнее прочитанное поколение маппингов:
+    пока индекс построен для другого поколения, is_current() ложно и
+    поиск идет в БД.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._index = MappingIndex.from_rows(())
+        self.generation = None
+        self.current_generation = None
+        self.loaded_at = None
+
+    def get(self, fake_phone):
+        return self._index.get_real(fake_phone)
+
+    def __len__(self):
+        return len(self._index)
+
+    def is_current(self):
+        return self.generation is not None and self.generation == self.current_generation
+
+    def is_stale(self):
+        generation = self.db.get_generation()
+        if generation is not None:
+            self.current_generation = generation
+        return generation is None or generation != self.generation
+
+    def reload(self):
+        # Поколение читается до загрузки: изменение во время чтения
+        # таблицы будет замечено следующей проверкой
+        generation = self.db.get_generation()
+        if generation is not None and (self.current_generation is None or generation > self.current_generation):
+            self.current_generation = generation
+        started = time.monotonic()
+        index = MappingIndex.from_rows(self.db.iter_mappings(), generation)
+        self._index = index
+        self.generation = generation
+        self.loaded_at = time.time()
+        logger.info(
+            "Индекс загружен: %s связок (%s байт), поколение %s, %.2f с",
+            len(index), index.nbytes(), generation, time.monotonic() - started
+        )
+
+
+async def read_agi_env(reader):
+    """Переменные agi_* из начала сессии (до пустой строки)"""
+    env = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        line = line.decode("utf-8", "replace").rstrip("\r\n")
+        if not line:
+            break
+        key, _, value = line.partition(":")
+        env[key.strip()] = value.strip()
+    return env
+
+
+async def agi_command(reader, writer, command):
+    """
+    Отправить команду AGI и прочитать ответ
+
+    Returns:
+        str: строка ответа ("200 result=1") или "" если канал закрыт
+    """
+    writer.write(command.encode("utf-8") + b"\n")
+    await writer.drain()
+    line = await reader.readline()
+    return line.decode("utf-8", "replace").strip()
+
+
+class AgiServer:
+    def __init__(self, db, index, call_log_writer, db_fallback=True):
+        self.db = db
+        self.index = index
+        self.call_log_writer = call_log_writer
+        self.db_fallback = db_fallback
+        self.stats = {
+            "requests": 0, "found": 0, "not_found": 0, "errors": 0,
+            "db_fallback": 0, "stale_index": 0,
+        }
+
+    async def resolve(self, fake_phone):
+        """
+        Returns:
+            tuple: (LOOKUP_STATUS, реальный номер или "")
+        """
+        real_phone = None
+        if self.index.is_current():
+            real_phone = self.index.get(fake_phone)
+            use_db = real_phone is None and self.db_fallback
+        else:
+            # Индекс устарел (маппинги изменились, перестройка еще идет):
+            # его ответ может вести на прежний реальный номер
+            self.stats["stale_index"] += 1
+            use_db = True
+
+        if use_db and fake_phone:
+            # Связка могла появиться после последней загрузки индекса
+            self.stats["db_fallback"] += 1
+            loop = asyncio.get_running_loop()
+            try:
+                real_phone = await loop.run_in_executor(
+                    None, lambda: self.db.get_real_phone(fake_phone, raise_errors=True)
+                )
+            except Exception as e:
+                logger.error("Ошибка поиска %s в БД: %s", fake_phone, e)
+                self.stats["errors"] += 1
+                return "ERROR", ""
+
+        if not real_phone:
+            self.stats["not_found"] += 1
+            return "NOTFOUND", ""
+
+        self.stats["found"] += 1
+        self.call_log_writer.log(fake_phone, real_phone)
+        return "FOUND", real_phone
+
+    async def handle(self, reader, writer):
+        self.stats["requests"] += 1
+        try:
+            env = await read_agi_env(reader)
+            fake_phone = normalize_phone(env.get("agi_arg_1") or env.get("agi_extension", ""))
+            status, real_phone = await self.resolve(fake_phone)
+
+            for command in (
+                f'SET VARIABLE REAL_PHONE "{real_phone}"',
+                f"SET VARIABLE LOOKUP_STATUS {status}",
+            ):
+                response = await agi_command(reader, writer, command)
+                if not response.startswith("200"):
+                    # HANGUP или закрытый канал — дальше команды не нужны
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.exception("Ошибка обработки AGI запроса: %s", e)
+        finally:
+            writer.close()
+
+    async def refresh_loop(self, interval):
+        """
+        Проверять поколение маппингов каждые interval секунд и перестраивать
+        индекс в фоне; проверки продолжаются во время перестройки, чтобы
+        устаревший индекс сразу перестал отвечать
+        """
+        loop = asyncio.get_running_loop()
+        reloading = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stale = await loop.run_in_executor(None, self.index.is_stale)
+            except Exception as e:
+                logger.error("Ошибка проверки поколения маппингов: %s", e)
+                continue
+            if stale and (reloading is None or reloading.done()):
+                reloading = loop.run_in_executor(None, self.index.reload)
+                reloading.add_done_callback(self._reload_done)
+
+    @staticmethod
+    def _reload_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Ошибка обновления индекса: %s", future.exception())
+
+    async def serve(self, host, port, refresh_interval):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info("FastAGI сервер слушает %s:%s", host, port)
+        refresher = asyncio.create_task(self.refresh_loop(refresh_interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+
+
+async def fake_agi_client(host, port, fake_phone):
+    """
+    Имитация Asterisk: отправить окружение AGI, на каждую команду
+    ответить "200 result=1" и вернуть выставленные переменные
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    env = {
+        "agi_network": "yes",
+        "agi_network_script": "lookup",
+        "agi_request": f"agi://{host}:{port}/lookup",
+        "agi_channel": "Local/test@incoming-agi",
+        "agi_extension": fake_phone,
+        "agi_arg_1": fake_phone,
+    }
+    for key, value in env.items():
+        writer.write(f"{key}: {value}\n".encode("utf-8"))
+    writer.write(b"\n")
+    await writer.drain()
+
+    variables = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line.decode("utf-8").strip()
+        if command.startswith("SET VARIABLE "):
+            name, _, value = command[len("SET VARIABLE "):].partition(" ")
+            variables[name] = value.strip('"')
+        writer.write(b"200 result=1\n")
+        await writer.drain()
+    writer.close()
+    return variables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("serve", "client"), default="serve")
+    parser.add_argument("phone", nargs="?", help="фейковый номер для режима client")
+    parser.add_argument("--host", default=Config.AGI_HOST)
+    parser.add_argument("--port", type=int, default=Config.AGI_PORT)
+    args = parser.parse_args()
+
+    if args.command == "client":
+        if not args.phone:
+            parser.error("для client нужен номер")
+        variables = asyncio.run(fake_agi_client(args.host, args.port, args.phone))
+        for name, value in variables.items():
+            print(f"{name}={value}")
+        sys.exit(0 if variables.get("LOOKUP_STATUS") == "FOUND" else 1)
+
+    setup_logging()
+    db = Database()
+    index = FakeToRealIndex(db)
+    try:
+        index.reload()
+    except Exception as e:
+        # Сервер все равно стартует: поиск через БД, индекс догрузит refresh_loop
+        logger.error("Не удалось загрузить индекс: %s", e)
+    call_log_writer = CallLogWriter(
+        db,
+        queue_size=Config.CALL_LOG_QUEUE_SIZE,
+        batch_size=Config.CALL_LOG_BATCH_SIZE,
+        flush_interval=Config.CALL_LOG_FLUSH_INTERVAL
+    )
+    server = AgiServer(db, index, call_log_writer, db_fallback=Config.AGI_DB_FALLBACK)
+    try:
+        asyncio.run(server.serve(args.host, args.port, Config.AGI_REFRESH_INTERVAL))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -21,5 +21,18 @@ def create_app():
     from app import routes
     app.register_blueprint(routes.bp)
     
+    # Метрики /metrics: время запросов, общий каталог для воркеров gunicorn
+    from app import metrics
+    metrics.instrument_app(app)
+    if app.config['METRICS_DIR']:
+        metrics.REGISTRY.share(app.config['METRICS_DIR'], app.config['METRICS_SHARE_INTERVAL'])
+    
+    # Поиск номера для Asterisk в обход Flask (text/plain, без сессии и CORS)
+    from app.asterisk import AsteriskLookupMiddleware
+    app.wsgi_app = AsteriskLookupMiddleware(
+        app.wsgi_app,
+        lambda fake_phone: routes.resolve_real_phone(fake_phone)
+    )
+    
     return app
 
@@ -0,0 +1,69 @@
+import time
+
+from app.metrics import HTTP_REQUEST_SECONDS
+from app.utils import normalize_phone
+
+
+# Ответы для Asterisk CURL(): готовые статусы и заголовки, тело — голый номер
+_STATUS_OK = '200 OK'
+_STATUS_NOT_FOUND = '404 Not Found'
+_STATUS_ERROR = '503 Service Unavailable'
+_STATUS_NOT_ALLOWED = '405 Method Not Allowed'
+_EMPTY_HEADERS = [('Content-Type', 'text/plain'), ('Content-Length', '0')]
+_EMPTY_BODY = [b'']
+
+
+class AsteriskLookupMiddleware:
+    """
+    Короткий путь поиска номера для диалплана Asterisk.
+
+    GET <prefix><fake_phone> обрабатывается до Flask: без сессии, CORS,
+    маршрутизации и JSON. Найденный номер возвращается как text/plain
+    (200), ненайденный — пустое тело с 404, ошибка БД — пустое тело с 503,
+    поэтому в диалплане достаточно проверить ${REAL_PHONE} на пустоту.
+    Остальные запросы передаются приложению без изменений.
+
+    lookup(normalized_fake_phone) возвращает реальный номер или None.
+    """
+
+    def __init__(self, app, lookup, prefix='/asterisk/lookup/real/'):
+        self.app = app
+        self.lookup = lookup
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix):
+            return self.app(environ, start_response)
+
+        method = environ.get('REQUEST_METHOD')
+        if method not in ('GET', 'HEAD'):
+            start_response(_STATUS_NOT_ALLOWED, list(_EMPTY_HEADERS))
+            return _EMPTY_BODY
+
+        started = time.perf_counter()
+        try:
+            real_phone = self.lookup(normalize_phone(path[len(self.prefix):]))
+        except Exception:
+            self._observe(method, '503', started)
+            start_response(_STATUS_ERROR, list(_EMPTY_HEADERS))
+            return _EMPTY_BODY
+
+        if not real_phone:
+            self._observe(method, '404', started)
+            start_response(_STATUS_NOT_FOUND, list(_EMPTY_HEADERS))
+            return _EMPTY_BODY
+
+        body = real_phone.encode('utf-8')
+        self._observe(method, '200', started)
+        start_response(_STATUS_OK, [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(body)))
+        ])
+        return [body]
+
+    @staticmethod
+    def _observe(method, status, started):
+        HTTP_REQUEST_SECONDS.labels('asterisk_lookup', method, status).observe(
+            time.perf_counter() - started
+        )
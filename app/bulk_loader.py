@@ -0,0 +1,164 @@
+import os
+import tempfile
+
+from mysql.connector import Error, IntegrityError
+
+from app.importer import iter_chunks
+from config import Config
+
+
+# Ошибки MySQL, означающие, что LOAD DATA LOCAL INFILE запрещен
+# на сервере или клиенте: в этом случае переходим на INSERT
+LOCAL_INFILE_DISABLED_ERRORS = {
+    1148,  # ER_NOT_ALLOWED_COMMAND
+    2068,  # CR_LOAD_DATA_LOCAL_INFILE_REJECTED
+    3948,  # ER_CLIENT_LOCAL_FILES_DISABLED
+}
+ER_DUP_ENTRY = 1062
+
+_TSV_ESCAPE = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+class InsertBulkLoader:
+    """Загрузка многострочными INSERT ... VALUES (...),(...) порциями по chunk_size"""
+
+    name = 'insert'
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+
+    def load(self, cursor, table, mappings):
+        """
+        Вставить маппинги в таблицу.
+
+        Args:
+            cursor: курсор открытого соединения (транзакцией управляет вызывающий)
+            table: имя таблицы
+            mappings: итерируемое кортежей (real_phone, fake_phone)
+
+        Returns:
+            int: количество вставленных строк
+        """
+        inserted = 0
+        for chunk in iter_chunks(mappings, self.chunk_size):
+            placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO {table} (real_phone, fake_phone) VALUES {placeholders}",
+                [value for mapping in chunk for value in mapping]
+            )
+            inserted += len(chunk)
+        return inserted
+
+
+class LoadDataBulkLoader:
+    """
+    Загрузка через LOAD DATA LOCAL INFILE из временного TSV файла.
+
+    Если LOCAL INFILE отключен на сервере или клиенте, те же данные
+    из TSV загружаются через InsertBulkLoader.
+
+    LOCAL INFILE молча пропускает строки с дублем уникального ключа
+    (неявный IGNORE), поэтому число загруженных строк сверяется с числом
+    записанных: расхождение — ошибка дубля, как у INSERT.
+    """
+
+    name = 'load_data'
+
+    def __init__(self, chunk_size=None, tmp_dir=None):
+        self.tmp_dir = tmp_dir or Config.BULK_LOAD_TMP_DIR
+        self.fallback = InsertBulkLoader(chunk_size)
+
+    def load(self, cursor, table, mappings):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='mappings_', suffix='.tsv', dir=self.tmp_dir)
+        try:
+            rows = 0
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+                for real_phone, fake_phone in mappings:
+                    f.write(
+                        f"{real_phone.translate(_TSV_ESCAPE)}\t"
+                        f"{fake_phone.translate(_TSV_ESCAPE)}\n"
+                    )
+                    rows += 1
+            if not rows:
+                return 0
+
+            try:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+                    "CHARACTER SET utf8mb4 "
+                    "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+                    "LINES TERMINATED BY '\\n' "
+                    "(real_phone, fake_phone)",
+                    (path,)
+                )
+            except Error as e:
+                if e.errno not in LOCAL_INFILE_DISABLED_ERRORS:
+                    raise
+                print(f"LOAD DATA LOCAL INFILE недоступен ({e}), загрузка через INSERT")
+                return self.fallback.load(cursor, table, _read_tsv(path))
+
+            if cursor.rowcount != rows:
+                raise IntegrityError(
+                    msg=f"LOAD DATA в {table}: загружено {cursor.rowcount} из {rows} строк "
+                        "(дубли уникальных номеров пропущены)",
+                    errno=ER_DUP_ENTRY
+                )
+            return rows
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _read_tsv(path):
+    """Прочитать TSV, записанный LoadDataBulkLoader"""
+    unescape = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        for line in f:
+            real_phone, fake_phone = line.rstrip('\n').split('\t')
+            if '\\' in real_phone or '\\' in fake_phone:
+                real_phone, fake_phone = (
+                    _unescape(value, unescape) for value in (real_phone, fake_phone)
+                )
+            yield real_phone, fake_phone
+
+
+def _unescape(value, table):
+    result = []
+    i = 0
+    while i < len(value):
+        pair = value[i:i + 2]
+        if pair in table:
+            result.append(table[pair])
+            i += 2
+        else:
+            result.append(value[i])
+            i += 1
+    return ''.join(result)
+
+
+BULK_LOADERS = {
+    InsertBulkLoader.name: InsertBulkLoader,
+    LoadDataBulkLoader.name: LoadDataBulkLoader,
+}
+
+
+def get_bulk_loader(loader=None, chunk_size=None):
+    """
+    Получить загрузчик по имени ('insert', 'load_data').
+
+    Args:
+        loader: имя загрузчика, готовый экземпляр или None (Config.BULK_LOADER)
+        chunk_size: размер порции INSERT
+
+    Raises:
+        ValueError: неизвестное имя загрузчика
+    """
+    if loader is not None and not isinstance(loader, str):
+        return loader
+    name = loader or Config.BULK_LOADER
+    if name not in BULK_LOADERS:
+        raise ValueError(f"Неизвестный загрузчик: {name}")
+    return BULK_LOADERS[name](chunk_size=chunk_size)
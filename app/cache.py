@@ -0,0 +1,214 @@
+import time
+import weakref
+from collections import OrderedDict
+from threading import Lock
+
+
+# Маркер отрицательного кэширования (номер точно отсутствует в БД)
+_MISSING = object()
+
+# Все наблюдатели поколений процесса — для мгновенной локальной инвалидации
+_watchers = weakref.WeakSet()
+_watchers_lock = Lock()
+
+
+def notify_mappings_changed():
+    """
+    Сообщить кэшам процесса, что phone_mappings изменилась.
+
+    Вызывается после commit операций записи: следующий запрос к кэшу
+    сразу перечитает поколение из БД, не дожидаясь интервала проверки.
+    """
+    with _watchers_lock:
+        watchers = list(_watchers)
+    for watcher in watchers:
+        watcher.expire()
+
+
+class GenerationWatcher:
+    """
+    Отслеживает счётчик поколений маппингов (таблица mapping_generation).
+
+    Счётчик увеличивается в той же транзакции, что и изменение phone_mappings,
+    поэтому все процессы (gunicorn-воркеры, import_worker) видят одно значение.
+    Чтобы не ходить в БД на каждый звонок, значение перечитывается не чаще
+    одного раза в check_interval секунд.
+    """
+
+    def __init__(self, fetch_generation, check_interval):
+        self._fetch = fetch_generation
+        self.check_interval = check_interval
+        self._generation = None
+        self._checked_at = 0.0
+        self._refresh_lock = Lock()
+        with _watchers_lock:
+            _watchers.add(self)
+
+    def expire(self):
+        self._checked_at = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._generation
+
+        # Перечитывает один поток, остальные пока используют прежнее значение
+        if not self._refresh_lock.acquire(blocking=self._generation is None):
+            return self._generation
+        try:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                generation = self._fetch()
+                if generation is not None:
+                    self._generation = generation
+                self._checked_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+        return self._generation
+
+
+class LookupCache:
+    """
+    Read-through кэш поиска номеров в памяти процесса.
+
+    - ограниченный размер с вытеснением LRU;
+    - TTL для найденных номеров и отдельный (короткий) TTL для ненайденных;
+    - полный сброс при смене поколения маппингов.
+
+    loader(key) должен возвращать значение или None (номер не найден)
+    и бросать исключение при ошибке БД — ошибки не кэшируются.
+    bulk_loader(keys) для get_many возвращает dict только найденных ключей.
+    """
+
+    def __init__(self, loader, watcher, max_size, ttl, negative_ttl, bulk_loader=None):
+        self._loader = loader
+        self._bulk_loader = bulk_loader
+        self._watcher = watcher
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._lock = Lock()
+        self._data = OrderedDict()  # key -> (value | _MISSING, expires_at)
+        self._generation = None
+
+        self._stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return self._loader(key)
+
+        generation = self._watcher.current()
+        now = time.monotonic()
+
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    if value is _MISSING:
+                        self._stats['negative_hits'] += 1
+                        return None
+                    self._stats['hits'] += 1
+                    return value
+                del self._data[key]
+            self._stats['misses'] += 1
+
+        value = self._loader(key)
+        self._store(key, value, generation)
+        return value
+
+    def get_many(self, keys):
+        """
+        Найти несколько ключей: из кэша, остальные одним вызовом bulk_loader
+
+        Returns:
+            dict: key -> значение или None для каждого ключа из keys
+        """
+        if self._bulk_loader is None:
+            return {key: self.get(key) for key in keys}
+
+        result = {}
+        missing = []
+        if self.max_size > 0:
+            generation = self._watcher.current()
+            now = time.monotonic()
+            with self._lock:
+                if generation != self._generation:
+                    self._reset(generation)
+                for key in keys:
+                    entry = self._data.get(key)
+                    if entry is not None and entry[1] > now:
+                        self._data.move_to_end(key)
+                        if entry[0] is _MISSING:
+                            self._stats['negative_hits'] += 1
+                            result[key] = None
+                        else:
+                            self._stats['hits'] += 1
+                            result[key] = entry[0]
+                    else:
+                        missing.append(key)
+                self._stats['misses'] += len(missing)
+        else:
+            missing = list(keys)
+
+        if missing:
+            found = self._bulk_loader(missing)
+            for key in missing:
+                value = found.get(key)
+                result[key] = value
+                if self.max_size > 0:
+                    self._store(key, value, generation)
+        return result
+
+    def _store(self, key, value, generation):
+        if value is None:
+            ttl = self.negative_ttl
+            if ttl <= 0:
+                return
+            value = _MISSING
+        else:
+            ttl = self.ttl
+
+        with self._lock:
+            # Пока шёл запрос в БД, поколение могло смениться
+            if generation != self._generation:
+                return
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _reset(self, generation):
+        if self._data:
+            self._data.clear()
+        if self._generation is not None:
+            self._stats['invalidations'] += 1
+        self._generation = generation
+
+    def invalidate(self):
+        """Сбросить кэш вручную"""
+        with self._lock:
+            self._data.clear()
+            self._stats['invalidations'] += 1
+        self._watcher.expire()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'generation': self._generation,
+            })
+        return data
@@ -0,0 +1,122 @@
+import atexit
+import os
+import queue
+import time
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+
+class CallLogWriter:
+    """
+    Фоновая запись логов звонков в call_logs.
+
+    Поиск номера только кладёт событие в ограниченную очередь и сразу
+    отвечает Asterisk. Отдельный поток пишет накопленные события
+    многострочным INSERT, когда набралось batch_size событий или прошло
+    flush_interval секунд. При переполнении очереди события отбрасываются
+    (счётчик dropped), поиск номера никогда не ждёт записи лога.
+    """
+
+    def __init__(self, db, queue_size, batch_size, flush_interval):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = Lock()
+        self._stats_lock = Lock()
+
+        self._stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+
+    def log(self, fake_phone, real_phone):
+        """Поставить звонок в очередь на запись (не блокирует)"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fake_phone, real_phone, datetime.now()))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def _ensure_started(self):
+        # Поток запускается лениво и заново после fork (gunicorn)
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != pid:
+                self._stop.clear()
+                self._pid = pid
+                self._thread = Thread(target=self._run, name='call-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+        # Дописываем остаток очереди при остановке
+        self._drain()
+
+    def _collect(self):
+        """Собрать пачку событий по размеру или по времени"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        success = self.db.log_calls_batch(batch)
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            if success:
+                self._stats['written'] += len(batch)
+            else:
+                self._stats['failed'] += len(batch)
+
+    def stop(self, timeout=10):
+        """Остановить поток, записав все оставшиеся события"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        data['queue_depth'] = self._queue.qsize()
+        data['queue_size'] = self._queue.maxsize
+        return data
@@ -0,0 +1,107 @@
+import hashlib
+from threading import Lock
+
+from config import Config
+
+
+class FakeNumberSpace:
+    """
+    Ключевая перестановка пространства фейковых номеров.
+
+    Номер = префикс + digits цифр, т.е. пространство [0, 10**digits).
+    Счетчик i отображается в номер сбалансированной сетью Фейстеля над
+    Z_m x Z_m (m = 10**ceil(digits/2)) с раундовой функцией keyed BLAKE2b;
+    для нечетного digits лишние значения отбрасываются cycle-walking.
+    Отображение биективно, поэтому разные счетчики всегда дают разные
+    номера, а порядок выдачи не угадывается без ключа.
+    """
+
+    ROUNDS = 8
+
+    def __init__(self, prefix, length, key):
+        self.prefix = prefix
+        self.digits = length - len(prefix)
+        if self.digits <= 0:
+            raise ValueError("FAKE_NUMBER_LENGTH должен быть больше длины префикса")
+        self.size = 10 ** self.digits
+        self.half = 10 ** ((self.digits + 1) // 2)
+        self.key = hashlib.blake2b(key.encode('utf-8'), digest_size=32).digest()
+
+    def _round(self, i, value):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, 'big') + bytes((i,)), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, 'big') % self.half
+
+    def _permute(self, x):
+        m = self.half
+        left, right = divmod(x, m)
+        for i in range(self.ROUNDS):
+            left, right = right, (left + self._round(i, right)) % m
+        return left * m + right
+
+    def number(self, counter):
+        """Фейковый номер для счетчика counter из [0, size)"""
+        if not 0 <= counter < self.size:
+            raise ValueError("Пространство фейковых номеров исчерпано")
+        value = self._permute(counter)
+        while value >= self.size:
+            value = self._permute(value)
+        return f"{self.prefix}{value:0{self.digits}d}"
+
+
+class FakePhoneAllocator:
+    """
+    Выдача уникальных фейковых номеров за O(1) без загрузки существующих.
+
+    Счетчики резервируются в БД блоками (таблица fake_allocator, атомарный
+    UPDATE), поэтому процессы не пересекаются между собой; номер получается
+    из счетчика перестановкой FakeNumberSpace. Номера, появившиеся в базе
+    другим путем (импорт файла, старый случайный генератор), отсеиваются
+    одной пакетной проверкой по выданной пачке.
+    """
+
+    def __init__(self, db, prefix=None, length=None, key=None, block_size=None):
+        self.db = db
+        self.space = FakeNumberSpace(
+            prefix if prefix is not None else Config.FAKE_NUMBER_PREFIX,
+            length or Config.FAKE_NUMBER_LENGTH,
+            key or Config.FAKE_NUMBER_KEY
+        )
+        self.block_size = block_size or Config.FAKE_ALLOCATOR_BLOCK
+        self._lock = Lock()
+        self._next = 0
+        self._end = 0
+
+    def _take_counters(self, n):
+        """Взять n счетчиков из локального блока, при нехватке зарезервировать в БД"""
+        counters = []
+        with self._lock:
+            while len(counters) < n:
+                if self._next >= self._end:
+                    need = max(n - len(counters), self.block_size)
+                    start = self.db.reserve_fake_counters(need)
+                    if start is None:
+                        raise ValueError("Не удалось зарезервировать фейковые номера в БД")
+                    self._next, self._end = start, start + need
+                take = min(n - len(counters), self._end - self._next)
+                counters.extend(range(self._next, self._next + take))
+                self._next += take
+        return counters
+
+    def allocate(self, n):
+        """
+        Выдать n уникальных фейковых номеров
+
+        Returns:
+            list: список номеров длиной n
+        """
+        result = []
+        while len(result) < n:
+            candidates = [self.space.number(c) for c in self._take_counters(n - len(result))]
+            taken = self.db.existing_fake_phones(candidates)
+            result.extend(phone for phone in candidates if phone not in taken)
+        return result
+
+    def allocate_one(self):
+        return self.allocate(1)[0]
@@ -0,0 +1,410 @@
+import csv
+from itertools import islice
+
+from app.utils import PHONE_BATCH_SIZE, normalize_phone, validate_phone, validate_phones
+
+
+def iter_csv_rows(path, delimiter=";"):
+    """
+    Построчно читать CSV файл импорта, пропуская заголовок.
+
+    Yields:
+        tuple(int, list): номер строки в файле (с учётом заголовка) и колонки
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        try:
+            next(reader)
+        except StopIteration:
+            raise ValueError("Файл пуст")
+
+        for idx, row in enumerate(reader, start=2):  # старт с 2 из-за заголовка
+            yield idx, row
+
+
+class _OffsetLines:
+    """Строки бинарного файла для csv.reader с учетом смещения в байтах"""
+
+    def __init__(self, f, offset):
+        self._f = f
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self._f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8")
+
+
+def iter_csv_rows_from(path, offset=0, idx=2, delimiter=";"):
+    """
+    Читать CSV файл импорта с заданного смещения (продолжение импорта).
+
+    csv.reader не читает вперед, поэтому после каждой строки смещение
+    указывает ровно на начало следующей: его можно сохранить в контрольной
+    точке и продолжить чтение с него.
+
+    Args:
+        offset: смещение в байтах (0 — начало файла, заголовок пропускается)
+        idx: номер первой читаемой строки
+
+    Yields:
+        tuple(int, list, int): номер строки, колонки, смещение после строки
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        lines = _OffsetLines(f, offset)
+        reader = csv.reader(lines, delimiter=delimiter)
+        if offset == 0:
+            try:
+                next(reader)
+            except StopIteration:
+                raise ValueError("Файл пуст")
+
+        for row in reader:
+            yield idx, row, lines.offset
+            idx += 1
+
+
+def parse_mapping_row(idx, row):
+    """
+    Провалидировать строку файла импорта.
+
+    Returns:
+        tuple(str, str): нормализованный real_phone и fake_phone
+
+    Raises:
+        ValueError: строка не проходит валидацию
+    """
+    if len(row) < 2:
+        raise ValueError(f"Недостаточно колонок в строке {idx}")
+
+    raw_real, raw_fake = row[0].strip(), row[1].strip()
+    if not raw_real or not raw_fake:
+        raise ValueError(f"Пустое значение в строке {idx}")
+
+    real_phone = normalize_phone(raw_real)
+    fake_phone = raw_fake  # фейковый может быть буквенно-цифровым хэшем
+
+    if not validate_phone(real_phone):
+        raise ValueError(f"Невалидный real_phone в строке {idx}: {raw_real}")
+
+    # Лёгкая валидация для fake: непустой, разумная длина
+    if len(fake_phone) < 3 or len(fake_phone) > 64:
+        raise ValueError(f"Невалидный fake_phone в строке {idx}: {raw_fake}")
+
+    return real_phone, fake_phone
+
+
+def _validate_rows(rows, report=None):
+    """
+    Валидировать поток (номер строки, колонки, ...) порциями.
+
+    real_phone нормализуется и валидируется порциями (validate_phones);
+    строка с любой ошибкой проверяется parse_mapping_row, поэтому первая
+    ошибка и ее текст те же, что при построчной проверке. Поля после
+    колонок передаются дальше без изменений.
+
+    Без report первая ошибка выбрасывается; с report ошибочные строки
+    записываются в него и пропускаются, пока не набран лимит ошибок.
+
+    Yields:
+        tuple: номер строки, real_phone, fake_phone, остальные поля
+    """
+    for chunk in iter_chunks(rows, PHONE_BATCH_SIZE):
+        batch = validate_phones([item[1][0].strip() if item[1] else '' for item in chunk])
+        for item, real_phone, valid in zip(chunk, batch.normalized, batch.valid):
+            idx, row = item[0], item[1]
+            if report is not None:
+                # Считаются проверенные строки, а не прочитанные порцией наперед
+                report.rows += 1
+            if valid and len(row) >= 2:
+                fake_phone = row[1].strip()
+                if 3 <= len(fake_phone) <= 64:
+                    yield (idx, real_phone, fake_phone) + item[2:]
+                    continue
+            try:
+                real_phone, fake_phone = parse_mapping_row(idx, row)
+            except ValueError as e:
+                if report is None:
+                    raise
+                if not report.add_error(idx, str(e), row):
+                    return
+                continue
+            yield (idx, real_phone, fake_phone) + item[2:]
+
+
+def iter_mapping_rows(path):
+    """
+    Потоково читать и валидировать файл импорта.
+
+    Yields:
+        tuple(int, str, str): номер строки, real_phone, fake_phone
+    """
+    return _validate_rows(iter_csv_rows(path))
+
+
+def iter_mapping_rows_from(path, offset=0, idx=2):
+    """
+    Потоково читать и валидировать файл импорта с заданного смещения.
+
+    Yields:
+        tuple(int, str, str, int): номер строки, real_phone, fake_phone,
+            смещение в байтах после строки
+    """
+    return _validate_rows(iter_csv_rows_from(path, offset, idx))
+
+
+# Позиция строки в наборе из нескольких файлов: номер файла << 40 | номер
+# строки, поэтому позиции всего набора растут в порядке файлов и строк
+SHARD_POSITION_BITS = 40
+
+
+def iter_sharded_mapping_rows(paths):
+    """
+    Потоково читать набор файлов импорта как один файл.
+
+    Yields:
+        tuple(int, str, str): позиция в наборе, real_phone, fake_phone
+    """
+    for shard, path in enumerate(paths):
+        offset = shard << SHARD_POSITION_BITS
+        for idx, real_phone, fake_phone in iter_mapping_rows(path):
+            yield offset | idx, real_phone, fake_phone
+
+
+def scan_mapping_file(path, shard=0):
+    """
+    Первый проход по файлу импорта: валидация и последние вхождения номеров.
+
+    Верхнеуровневая функция, чтобы ее можно было выполнять в пуле процессов
+    для частей набора; позиции строк — как в iter_sharded_mapping_rows.
+
+    Returns:
+        MappingDeduper: для слияния через merge() и второго прохода
+    """
+    deduper = MappingDeduper()
+    offset = shard << SHARD_POSITION_BITS
+    for idx, real_phone, fake_phone in iter_mapping_rows(path):
+        deduper.add(offset | idx, real_phone, fake_phone)
+    return deduper
+
+
+class MappingValidationError(ValueError):
+    """Файл импорта не прошел предварительную проверку (подробности в report)"""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+class ValidationReport:
+    """
+    Результат предварительной проверки файла импорта.
+
+    Хранит не больше max_errors ошибок (номер строки, текст, значения
+    колонок); на следующей ошибке после лимита проверка останавливается
+    и отчет помечается как неполный. rows — число проверенных строк. Статистика дублей: real_overwritten — строки, чей
+    real_phone уже встречался (прежняя связка перезаписывается),
+    fake_reassigned — строки, чей fake_phone уже встречался (прежняя
+    строка с этим fake выбывает).
+    """
+
+    def __init__(self, max_errors, file_name=None):
+        self.max_errors = max_errors
+        self.file_name = file_name
+        self.rows = 0
+        self.error_count = 0
+        self.errors = []
+        self.truncated = False
+        self.real_overwritten = None
+        self.fake_reassigned = None
+
+    def add_error(self, idx, message, row):
+        """Записать ошибку; False — ошибок больше лимита, проверку пора остановить"""
+        self.error_count += 1
+        if self.error_count > self.max_errors:
+            self.truncated = True
+            return False
+        error = {'row': idx, 'error': message, 'values': row[:2]}
+        if self.file_name is not None:
+            error['file'] = self.file_name
+        self.errors.append(error)
+        return True
+
+    def merge(self, other):
+        """Добавить отчет по следующей части набора"""
+        self.rows += other.rows
+        self.error_count += other.error_count
+        room = max(0, self.max_errors - len(self.errors))
+        self.errors.extend(other.errors[:room])
+        self.truncated = self.truncated or other.truncated or len(other.errors) > room
+
+    def as_dict(self):
+        data = {
+            'rows': self.rows,
+            'error_count': self.error_count,
+            'errors_truncated': self.truncated,
+            'max_errors': self.max_errors,
+            'errors': self.errors,
+        }
+        if self.real_overwritten is not None:
+            data['duplicates'] = {
+                'real_overwritten': self.real_overwritten,
+                'fake_reassigned': self.fake_reassigned,
+            }
+        return data
+
+
+def prevalidate_mapping_file(path, max_errors, count_duplicates=True, file_name=None):
+    """
+    Быстрая проверка файла импорта до любых обращений к БД.
+
+    Файл читается потоково, ошибки собираются до max_errors, дальше
+    проверка останавливается. Дубли считаются по множествам упакованных
+    номеров (phone_key) без словарей номер -> строка.
+
+    Returns:
+        ValidationReport
+    """
+    report = ValidationReport(max_errors, file_name)
+    seen_real = set()
+    seen_fake = set()
+    real_overwritten = fake_reassigned = 0
+
+    for _, real_phone, fake_phone in _validate_rows(iter_csv_rows(path), report):
+        if not count_duplicates:
+            continue
+        real_key = phone_key(real_phone)
+        if real_key in seen_real:
+            real_overwritten += 1
+        else:
+            seen_real.add(real_key)
+        fake_key = phone_key(fake_phone)
+        if fake_key in seen_fake:
+            fake_reassigned += 1
+        else:
+            seen_fake.add(fake_key)
+
+    if count_duplicates and not report.truncated:
+        report.real_overwritten = real_overwritten
+        report.fake_reassigned = fake_reassigned
+    return report
+
+
+def phone_key(phone):
+    """
+    Компактный ключ номера для словарей дедупликации.
+
+    Цифровые номера упаковываются в int (ведущая 1 сохраняет ведущие нули),
+    буквенно-цифровые фейковые хэши остаются строками.
+    """
+    if phone.isdigit() and phone.isascii():
+        return int("1" + phone)
+    return phone
+
+
+class MappingDeduper:
+    """
+    Инкрементальная дедупликация маппингов без хранения строк файла.
+
+    Правило файла импорта: при повторе real_phone побеждает последняя строка,
+    а строка, чей fake_phone позже назначен другому real_phone, выбывает.
+    Это равносильно тому, что строка попадает в результат тогда и только
+    тогда, когда она последняя и для своего real_phone, и для своего fake_phone.
+
+    Первый проход (add) запоминает номер последней строки для каждого ключа,
+    второй проход (survivors) по тем же строкам отдаёт только выжившие.
+    Память пропорциональна числу различных номеров, а не размеру файла.
+
+    После полного второго прохода has_real() отвечает, остался ли у
+    real_phone маппинг в итоговом наборе (нужно для delta-импорта).
+    """
+
+    def __init__(self):
+        self._last_real = {}
+        self._last_fake = {}
+        self.total_rows = 0
+
+    def add(self, pos, real_phone, fake_phone):
+        self._last_real[phone_key(real_phone)] = pos
+        self._last_fake[phone_key(fake_phone)] = pos
+        self.total_rows += 1
+
+    def merge(self, other):
+        """
+        Добавить первый проход по следующей части набора.
+
+        Все позиции other должны быть больше позиций self (части сливаются
+        по порядку), тогда последние вхождения номеров те же, что при
+        одном проходе по всему набору.
+        """
+        self._last_real.update(other._last_real)
+        self._last_fake.update(other._last_fake)
+        self.total_rows += other.total_rows
+
+    def survivors(self, rows):
+        """
+        Отфильтровать выжившие маппинги при повторном проходе по строкам.
+
+        Args:
+            rows: итерируемое (pos, real_phone, fake_phone) в том же порядке,
+                что и при add()
+
+        Yields:
+            tuple(str, str): (real_phone, fake_phone)
+        """
+        last_real = self._last_real
+        last_fake = self._last_fake
+        for pos, real_phone, fake_phone in rows:
+            real_key = phone_key(real_phone)
+            if last_real.get(real_key) != pos:
+                continue
+            if last_fake.get(phone_key(fake_phone)) == pos:
+                yield real_phone, fake_phone
+            else:
+                # Последняя строка real_phone выбыла — маппинга у него не будет
+                del last_real[real_key]
+
+    def has_real(self, real_phone):
+        """Есть ли у real_phone маппинг в итоговом наборе (после survivors)"""
+        return phone_key(real_phone) in self._last_real
+
+
+class StagedSurvivors:
+    """
+    Итоговые маппинги, дедуплицированные в SQL (импорт через staging-таблицу).
+
+    Итерируется как MappingDeduper.survivors(); при track_real запоминает
+    отданные real_phone, чтобы после полного прохода отвечать has_real()
+    для delta-импорта.
+    """
+
+    def __init__(self, rows, track_real=False):
+        self._rows = rows
+        self._real = set() if track_real else None
+
+    def __iter__(self):
+        if self._real is None:
+            yield from self._rows
+            return
+        for real_phone, fake_phone in self._rows:
+            self._real.add(phone_key(real_phone))
+            yield real_phone, fake_phone
+
+    def has_real(self, real_phone):
+        return phone_key(real_phone) in self._real
+
+
+def iter_chunks(iterable, size):
+    """Разбить поток на списки фиксированного размера"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,283 @@
+import csv
+import json
+import os
+import re
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+
+from mysql.connector import IntegrityError
+
+from app.bulk_loader import ER_DUP_ENTRY
+from app.importer import iter_chunks
+from app.utils import parse_csv_phones, pid_alive
+from config import Config
+
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+# Статусы незавершенного задания
+ACTIVE_STATUSES = ('queued', 'parsing', 'running')
+
+
+class UploadJobStore:
+    """
+    Состояние фоновых загрузок в файлах каталога UPLOAD_JOBS_DIR.
+
+    Каждое задание — <id>.json (статус и прогресс, перезаписывается атомарно
+    через os.replace) и <id>.csv (результат). Файлы доступны всем процессам
+    gunicorn, поэтому /jobs/<id> отвечает любой воркер, а не только тот,
+    что принял загрузку.
+
+    В задании записаны хост и pid процесса-исполнителя: незавершенное
+    задание умершего процесса помечается failed (fail_orphans при старте
+    и fail_if_orphaned при запросе статуса), иначе страница ждала бы его
+    вечно.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        if not JOB_ID_RE.match(job_id):
+            raise ValueError("Некорректный идентификатор задания")
+        return os.path.join(self.directory, f"{job_id}{suffix}")
+
+    def upload_path(self, job_id):
+        return self._path(job_id, '.upload')
+
+    def result_path(self, job_id):
+        return self._path(job_id, '.csv')
+
+    def create(self, **fields):
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow().isoformat() + 'Z'
+        self.save(job_id, dict(
+            fields, id=job_id, status='queued', created_at=now, updated_at=now,
+            host=socket.gethostname(), pid=os.getpid()
+        ))
+        return job_id
+
+    def save(self, job_id, data):
+        path = self._path(job_id, '.json')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, job_id):
+        try:
+            with open(self._path(job_id, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def fail_if_orphaned(self, job):
+        """
+        Пометить failed незавершенное задание, процесс которого завершился
+
+        Returns:
+            dict: задание (обновленное, если оно было брошено)
+        """
+        if job.get('status') not in ACTIVE_STATUSES or job.get('pid') is None \
+                or job.get('host') != socket.gethostname() or pid_alive(job['pid']):
+            return job
+        job = dict(
+            job, status='failed', error='Процесс обработки завершился, загрузите файл заново',
+            updated_at=datetime.utcnow().isoformat() + 'Z'
+        )
+        self.save(job['id'], job)
+        try:
+            os.remove(self.upload_path(job['id']))
+        except OSError:
+            pass
+        return job
+
+    def fail_orphans(self):
+        """Пометить failed все брошенные задания (при старте процесса)"""
+        for name in os.listdir(self.directory):
+            job_id, ext = os.path.splitext(name)
+            if ext != '.json' or not JOB_ID_RE.match(job_id):
+                continue
+            job = self.get(job_id)
+            if job is not None:
+                self.fail_if_orphaned(job)
+
+    def cleanup(self, max_age):
+        """Удалить файлы заданий старше max_age секунд"""
+        threshold = time.time() - max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < threshold:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class UploadJob:
+    """Прогресс одного задания с периодическим сохранением в хранилище"""
+
+    SAVE_INTERVAL = 0.5  # seconds
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.id = job_id
+        self.data = store.get(job_id) or {'id': job_id}
+        self._saved_at = 0.0
+        self._started = None
+
+    def update(self, force=False, **fields):
+        self.data.update(fields)
+        now = time.monotonic()
+        if self._started is not None and self.data.get('rows_total'):
+            elapsed = now - self._started
+            done = self.data.get('rows_done', 0)
+            throughput = done / elapsed if elapsed > 0 else None
+            self.data['throughput_rows_sec'] = throughput
+            self.data['eta_sec'] = (
+                (self.data['rows_total'] - done) / throughput if throughput else None
+            )
+        if force or now - self._saved_at >= self.SAVE_INTERVAL:
+            self.data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+            self.store.save(self.id, self.data)
+            self._saved_at = now
+
+    def start_progress(self, rows_total):
+        self._started = time.monotonic()
+        self.update(force=True, status='running', rows_total=rows_total, rows_done=0)
+
+
+def process_upload(db, allocator, job, filepath, clear_old, loader, chunk_size):
+    """
+    Обработать загруженный файл порциями, записывая результат в CSV задания
+
+    Каждая порция: пакетный поиск уже известных номеров, выдача фейковых
+    для новых и вставка в БД. Прогресс сохраняется после каждой порции.
+    Если номер порции успела занять параллельная загрузка (дубль ключа),
+    порция повторяется до UPLOAD_JOB_CONFLICT_RETRIES раз: известные номера
+    перечитываются, для новых выдаются свежие фейковые.
+    """
+    job.update(force=True, status='parsing')
+    real_phones = parse_csv_phones(filepath)
+    if not real_phones:
+        raise ValueError('В файле не найдено валидных номеров')
+
+    if clear_old:
+        db.clear_all_mappings()
+
+    job.start_progress(len(real_phones))
+    new_count = existing_count = conflicts = 0
+
+    with open(job.store.result_path(job.id), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['real_phone', 'fake_phone', 'status'])
+
+        for chunk in iter_chunks(real_phones, chunk_size):
+            for attempt in range(Config.UPLOAD_JOB_CONFLICT_RETRIES + 1):
+                existing = {} if clear_old and not attempt else db.get_fake_phones_bulk(chunk)
+                new_real_phones = [phone for phone in chunk if phone not in existing]
+                mappings = list(zip(new_real_phones, allocator.allocate(len(new_real_phones))))
+                if not mappings:
+                    break
+                try:
+                    if not db.insert_mappings_batch(mappings, loader=loader, raise_errors=True):
+                        raise ValueError('Ошибка сохранения в базу данных')
+                    break
+                except IntegrityError as e:
+                    if e.errno != ER_DUP_ENTRY or attempt == Config.UPLOAD_JOB_CONFLICT_RETRIES:
+                        raise ValueError(f'Ошибка сохранения в базу данных: {e}')
+                    conflicts += 1
+
+            writer.writerows(
+                (phone, existing[phone], 'existing') for phone in chunk if phone in existing
+            )
+            writer.writerows((real, fake, 'new') for real, fake in mappings)
+
+            new_count += len(mappings)
+            existing_count += len(chunk) - len(mappings)
+            job.update(
+                rows_done=new_count + existing_count,
+                new=new_count,
+                existing=existing_count,
+                conflicts=conflicts
+            )
+
+    return {
+        'total': len(real_phones), 'new': new_count, 'existing': existing_count,
+        'conflicts': conflicts
+    }
+
+
+class UploadJobManager:
+    """
+    Очередь фоновых загрузок.
+
+    Загрузки выполняются в небольшом пуле потоков (UPLOAD_JOB_WORKERS),
+    поэтому несколько файлов обрабатываются параллельно, а остальные
+    потоки процесса остаются свободны для /lookup.
+    """
+
+    def __init__(self, db, allocator, store, workers, chunk_size):
+        self.db = db
+        self.allocator = allocator
+        self.store = store
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._pid = None
+        self._lock = Lock()
+        # Задания, брошенные прежним процессом (рестарт, падение воркера)
+        self.store.fail_orphans()
+
+    def _get_executor(self):
+        # Пул создается лениво и заново после fork (gunicorn)
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='upload-job'
+                )
+                self._pid = pid
+            return self._executor
+
+    def submit(self, file_storage, clear_old, loader):
+        """
+        Сохранить файл и поставить задание в очередь
+
+        Returns:
+            str: идентификатор задания
+        """
+        self.store.cleanup(Config.UPLOAD_JOB_TTL)
+        job_id = self.store.create(
+            filename=file_storage.filename, clear_old=clear_old, loader=loader
+        )
+        filepath = self.store.upload_path(job_id)
+        file_storage.save(filepath)
+        self._get_executor().submit(self._run, job_id, filepath, clear_old, loader)
+        return job_id
+
+    def _run(self, job_id, filepath, clear_old, loader):
+        job = UploadJob(self.store, job_id)
+        started = time.monotonic()
+        try:
+            summary = process_upload(
+                self.db, self.allocator, job, filepath, clear_old, loader, self.chunk_size
+            )
+            job.update(
+                force=True, status='done', eta_sec=0,
+                duration_sec=time.monotonic() - started, **summary
+            )
+        except Exception as e:
+            job.update(
+                force=True, status='failed', error=str(e),
+                duration_sec=time.monotonic() - started
+            )
+        finally:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
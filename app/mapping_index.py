@@ -0,0 +1,227 @@
+import operator
+import os
+import time
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from threading import Lock, Thread
+
+from app.importer import iter_mapping_rows, scan_mapping_file
+
+
+# Цифровой номер до 18 цифр упаковывается в uint64 как int("1" + digits):
+# ведущая 1 сохраняет ведущие нули, 10**19 < 2**64
+MAX_PACKED_DIGITS = 18
+_MASK64 = (1 << 64) - 1
+
+
+def pack_phone(phone):
+    """Номер -> uint64 или None, если номер не упаковывается"""
+    if len(phone) <= MAX_PACKED_DIGITS and phone.isdigit() and phone.isascii():
+        return int("1" + phone)
+    return None
+
+
+def unpack_phone(value):
+    return str(value)[1:]
+
+
+def _sort_pairs(keys, values):
+    """
+    Отсортировать параллельные array('Q') по ключам
+
+    Уже упорядоченные ключи (строки прочитаны по возрастанию) возвращаются
+    как есть. Иначе пары упаковываются в одно int (ключ << 64 | значение):
+    array не сортируется на месте, поэтому временный список int все же
+    нужен, но только для одной стороны индекса за раз.
+    """
+    if all(map(operator.le, keys, islice(keys, 1, None))):
+        return keys, values
+    pairs = [key << 64 | value for key, value in zip(keys, values)]
+    pairs.sort()
+    keys = array('Q', (pair >> 64 for pair in pairs))
+    values = array('Q', (pair & _MASK64 for pair in pairs))
+    return keys, values
+
+
+class MappingIndex:
+    """
+    Неизменяемый компактный индекс связок для поиска в обе стороны.
+
+    Номера хранятся парами uint64 в отсортированных array('Q'):
+    fake -> real и real -> fake, 32 байта на связку вместо сотен байт
+    у dict строк. Поиск — бинарный (bisect по массиву ключей).
+    Номера, которые не упаковываются в uint64 (буквы, больше 18 цифр),
+    лежат в небольших словарях overflow.
+    """
+
+    def __init__(self, fake_keys, fake_values, real_keys, real_values,
+                 fake_overflow, real_overflow, generation=None):
+        self._fake_keys = fake_keys
+        self._fake_values = fake_values
+        self._real_keys = real_keys
+        self._real_values = real_values
+        self._fake_overflow = fake_overflow
+        self._real_overflow = real_overflow
+        self.generation = generation
+
+    @classmethod
+    def from_rows(cls, rows, generation=None):
+        """
+        Построить индекс из пар (real_phone, fake_phone)
+
+        Упакованные номера сразу пишутся в array('Q') (16 байт на связку),
+        затем стороны fake -> real и real -> fake сортируются по очереди.
+        """
+        fakes = array('Q')
+        reals = array('Q')
+        fake_overflow = {}
+        real_overflow = {}
+        for real_phone, fake_phone in rows:
+            real_packed = pack_phone(real_phone)
+            fake_packed = pack_phone(fake_phone)
+            if real_packed is None or fake_packed is None:
+                fake_overflow[fake_phone] = real_phone
+                real_overflow[real_phone] = fake_phone
+                continue
+            fakes.append(fake_packed)
+            reals.append(real_packed)
+
+        fake_keys, fake_values = _sort_pairs(fakes, reals)
+        del fakes, reals
+        real_keys, real_values = _sort_pairs(fake_values, fake_keys)
+        return cls(fake_keys, fake_values, real_keys, real_values,
+                   fake_overflow, real_overflow, generation)
+
+    @classmethod
+    def from_file(cls, path, generation=None):
+        """Построить индекс из файла импорта с теми же правилами дедупликации"""
+        deduper = scan_mapping_file(path)
+        return cls.from_rows(deduper.survivors(iter_mapping_rows(path)), generation)
+
+    @staticmethod
+    def _search(keys, values, overflow, phone):
+        packed = pack_phone(phone)
+        if packed is not None:
+            pos = bisect_left(keys, packed)
+            if pos < len(keys) and keys[pos] == packed:
+                return unpack_phone(values[pos])
+        # Связка попадает в overflow, если не упаковывается хотя бы один из номеров
+        return overflow.get(phone) if overflow else None
+
+    def get_real(self, fake_phone):
+        """Реальный номер по фейковому или None"""
+        return self._search(self._fake_keys, self._fake_values, self._fake_overflow, fake_phone)
+
+    def get_fake(self, real_phone):
+        """Фейковый номер по реальному или None"""
+        return self._search(self._real_keys, self._real_values, self._real_overflow, real_phone)
+
+    def arrays(self):
+        """Массивы и overflow fake -> real для сериализации (app/snapshot.py)"""
+        return (self._fake_keys, self._fake_values, self._real_keys,
+                self._real_values, self._fake_overflow)
+
+    def __len__(self):
+        return len(self._fake_keys) + len(self._fake_overflow)
+
+    def nbytes(self):
+        """Размер упакованных массивов (без overflow)"""
+        return sum(
+            data.itemsize * len(data)
+            for data in (self._fake_keys, self._fake_values, self._real_keys, self._real_values)
+        )
+
+
+class LiveMappingIndex:
+    """
+    MappingIndex процесса, перестраиваемый в фоне при смене поколения маппингов.
+
+    current() возвращает индекс, только если он построен для текущего
+    поколения; иначе None (вызывающий идет в MySQL) и запускается
+    перестройка в фоновом потоке. После ошибки построения следующая
+    попытка — не раньше чем через retry_interval секунд.
+
+    Перестройка читает всю таблицу, поэтому после смены поколения она
+    откладывается, пока поколение не продержится rebuild_delay секунд:
+    фоновая загрузка /upload меняет поколение на каждой порции, и без
+    задержки каждый процесс перестраивал бы индекс после каждой порции.
+    Первое построение (индекса еще нет) начинается сразу.
+    """
+
+    def __init__(self, load_rows, fetch_generation, watcher, retry_interval=30, rebuild_delay=0):
+        self._load_rows = load_rows
+        self._fetch_generation = fetch_generation
+        self._watcher = watcher
+        self.retry_interval = retry_interval
+        self.rebuild_delay = rebuild_delay
+
+        self._lock = Lock()
+        self._index = None
+        self._building = False
+        self._failed_at = 0.0
+        # Поколение, ожидающее перестройки, и когда оно впервые замечено
+        self._pending_generation = None
+        self._pending_since = 0.0
+        self._pid = os.getpid()
+        self._stats = {'builds': 0, 'build_errors': 0, 'last_build_sec': None, 'deferred': 0}
+
+    def current(self):
+        generation = self._watcher.current()
+        index = self._index
+        if index is not None and generation is not None and index.generation == generation:
+            return index
+        self._schedule_build(generation)
+        return None
+
+    def _schedule_build(self, generation):
+        with self._lock:
+            if self._pid != os.getpid():
+                # После fork поток построения родителя в этом процессе не существует
+                self._pid = os.getpid()
+                self._building = False
+            now = time.monotonic()
+            if self._building or now - self._failed_at < self.retry_interval:
+                return
+            if generation != self._pending_generation:
+                self._pending_generation = generation
+                self._pending_since = now
+            if self._index is not None and now - self._pending_since < self.rebuild_delay:
+                self._stats['deferred'] += 1
+                return
+            self._building = True
+        Thread(target=self._build, name='mapping-index', daemon=True).start()
+
+    def _build(self):
+        started = time.monotonic()
+        try:
+            # Поколение читается до загрузки: изменения во время чтения
+            # таблицы дадут новое поколение и повторное построение
+            generation = self._fetch_generation()
+            if generation is None:
+                raise RuntimeError("Не удалось прочитать поколение маппингов")
+            index = MappingIndex.from_rows(self._load_rows(), generation)
+            with self._lock:
+                self._index = index
+                self._stats['builds'] += 1
+                self._stats['last_build_sec'] = time.monotonic() - started
+        except Exception as e:
+            print(f"Ошибка построения индекса маппингов: {e}")
+            with self._lock:
+                self._failed_at = time.monotonic()
+                self._stats['build_errors'] += 1
+        finally:
+            with self._lock:
+                self._building = False
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            index = self._index
+            data.update({
+                'building': self._building,
+                'entries': len(index) if index is not None else 0,
+                'bytes': index.nbytes() if index is not None else 0,
+                'generation': index.generation if index is not None else None,
+            })
+        return data
@@ -0,0 +1,458 @@
+import atexit
+import json
+import os
+import time
+from bisect import bisect_left
+from functools import wraps
+from threading import Event, Lock, Thread
+
+from app.pool import current_pool
+from app.utils import pid_alive
+
+
+# Метрики в текстовом формате Prometheus (exposition format 0.0.4) без
+# внешних зависимостей. Обновление метрики — один захват блокировки,
+# поэтому инструментирование пути /lookup почти ничего не стоит.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Поиск номера укладывается в доли миллисекунды, запросы к БД — в миллисекунды
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+IMPORT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+# Файлы завершившихся процессов в общем каталоге удаляются через час
+STALE_TTL = 3600  # seconds
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+        return f'{name}{{{label_text}}} {_format_value(value)}'
+    return f'{name} {_format_value(value)}'
+
+
+class _Timer:
+    """Замер длительности в histogram: контекстный менеджер и декоратор"""
+
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._started)
+
+    def __call__(self, func):
+        histogram = self._histogram
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+
+
+class _CounterValue:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self, metric):
+        self._lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(f'{name}_total', labels, self.value)]
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class _HistogramValue:
+    __slots__ = ('_lock', '_bounds', '_counts', '_sum')
+
+    def __init__(self, metric):
+        self._lock = Lock()
+        self._bounds = metric.buckets
+        # Последняя корзина — значения больше верхней границы (+Inf)
+        self._counts = [0] * (len(metric.buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        position = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[position] += 1
+            self._sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        result = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float('inf'),), counts):
+            cumulative += count
+            result.append((f'{name}_bucket', labels + (('le', _format_value(float(bound))),), cumulative))
+        result.append((f'{name}_sum', labels, total_sum))
+        result.append((f'{name}_count', labels, cumulative))
+        return result
+
+
+class _Metric:
+    """
+    Метрика с необязательными метками.
+
+    labels(*values) возвращает значение для набора меток (создается при
+    первом обращении); у метрики без меток методы inc/set/observe
+    вызываются напрямую.
+    """
+
+    type = None
+    _value_class = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with self._lock:
+                value = self._values.setdefault(values, self._value_class(self))
+        return value
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        result = []
+        for values, value in items:
+            labels = tuple(zip(self.labelnames, (str(v) for v in values)))
+            result.extend(value.samples(self.name, labels))
+        return result
+
+
+class Counter(_Metric):
+    type = 'counter'
+    _value_class = _CounterValue
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+    _value_class = _GaugeValue
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+    _value_class = _HistogramValue
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(float(bound) for bound in sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return _Timer(self._default)
+
+
+def stats_families(prefix, stats, counters=(), gauges=(), documentation=''):
+    """
+    Словарь stats() компонента (пул, кэш, лог звонков) -> семейства метрик
+
+    Ключи из counters становятся <prefix>_<key>_total, из gauges —
+    <prefix>_<key>. Отсутствующие и нечисловые значения пропускаются.
+    """
+    families = []
+    for keys, metric_type in ((counters, 'counter'), (gauges, 'gauge')):
+        for key in keys:
+            value = stats.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'{prefix}_{key}'
+            sample_name = f'{name}_total' if metric_type == 'counter' else name
+            families.append({
+                'name': name,
+                'type': metric_type,
+                'help': f'{documentation} ({key})' if documentation else key,
+                'samples': [(sample_name, (), value)],
+            })
+    return families
+
+
+class Registry:
+    """
+    Набор метрик процесса и его вывод для /metrics.
+
+    Коллекторы — функции без аргументов, возвращающие семейства
+    (stats_families) на момент запроса: так в /metrics попадает статистика
+    пула, кэша и лога звонков без отдельного учета на горячем пути.
+
+    После share(directory) процесс раз в interval секунд сохраняет свои
+    метрики в <directory>/<pid>.json, а render() суммирует файлы всех
+    процессов: любой воркер gunicorn отвечает на /metrics за все сразу.
+    Счетчики завершившихся процессов учитываются еще STALE_TTL секунд,
+    их gauge — нет.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = Lock()
+        self._share_dir = None
+        self._share_interval = None
+        self._share_stop = Event()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def add_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def collect(self):
+        """Семейства метрик этого процесса"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        families = [
+            {'name': m.name, 'type': m.type, 'help': m.documentation, 'samples': m.samples()}
+            for m in metrics
+        ]
+        for collect in collectors:
+            try:
+                families.extend(collect())
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+        return families
+
+    def render(self):
+        """Текст для ответа /metrics"""
+        families = self.collect()
+        if self._share_dir is not None:
+            self._dump(families)
+            families = self._merge_shared(families)
+
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family['name']} {_escape(family['help'])}")
+            lines.append(f"# TYPE {family['name']} {family['type']}")
+            for name, labels, value in family['samples']:
+                lines.append(_format_sample(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+    # --- общий каталог для нескольких процессов ---
+
+    def share(self, directory, interval):
+        """Включить обмен метриками между процессами через каталог"""
+        os.makedirs(directory, exist_ok=True)
+        self._share_dir = directory
+        self._share_interval = interval
+        self._start_dumper()
+        atexit.register(self._dump_now)
+        # Воркеры gunicorn с --preload наследуют реестр без потока сохранения
+        os.register_at_fork(after_in_child=self._start_dumper)
+
+    def _start_dumper(self):
+        if self._share_dir is None:
+            return
+        self._share_stop = Event()
+        Thread(target=self._dump_loop, args=(self._share_stop,), name='metrics-share', daemon=True).start()
+
+    def _dump_loop(self, stop):
+        while not stop.wait(self._share_interval):
+            self._dump_now()
+
+    def _dump_now(self):
+        try:
+            self._dump(self.collect())
+        except Exception as e:
+            print(f"Ошибка сохранения метрик: {e}")
+
+    def _dump(self, families):
+        path = os.path.join(self._share_dir, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(families, f)
+        os.replace(tmp_path, path)
+
+    def _merge_shared(self, own_families):
+        merged = {}
+        order = []
+
+        def add(families, include_gauges=True):
+            for family in families:
+                if family['type'] == 'gauge' and not include_gauges:
+                    continue
+                entry = merged.get(family['name'])
+                if entry is None:
+                    entry = merged[family['name']] = dict(family, samples={})
+                    order.append(family['name'])
+                samples = entry['samples']
+                for name, labels, value in family['samples']:
+                    key = (name, tuple(tuple(pair) for pair in labels))
+                    samples[key] = samples.get(key, 0) + value
+
+        add(own_families)
+        own_pid = os.getpid()
+        now = time.time()
+        for file_name in os.listdir(self._share_dir):
+            pid_text, _, extension = file_name.partition('.')
+            if extension != 'json' or not pid_text.isdigit() or int(pid_text) == own_pid:
+                continue
+            path = os.path.join(self._share_dir, file_name)
+            alive = pid_alive(int(pid_text))
+            try:
+                if not alive and now - os.path.getmtime(path) > STALE_TTL:
+                    os.remove(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    add(json.load(f), include_gauges=alive)
+            except (OSError, ValueError):
+                continue
+
+        return [
+            dict(merged[name], samples=[
+                (sample_name, labels, value)
+                for (sample_name, labels), value in merged[name]['samples'].items()
+            ])
+            for name in order
+        ]
+
+
+REGISTRY = Registry()
+
+
+def _pool_families():
+    pool = current_pool()
+    if pool is None:
+        return []
+    return stats_families(
+        'phone_proxy_mysql_pool', pool.stats(),
+        counters=('created', 'reused', 'reconnected', 'discarded', 'waits', 'timeouts', 'errors'),
+        gauges=('size', 'in_use', 'idle'),
+        documentation='Пул соединений MySQL'
+    )
+
+
+REGISTRY.add_collector(_pool_families)
+
+
+# --- метрики приложения ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'phone_proxy_http_request_duration_seconds',
+    'Время обработки HTTP-запроса до отправки заголовков ответа',
+    ('endpoint', 'method', 'status')
+)
+DB_QUERY_SECONDS = Histogram(
+    'phone_proxy_db_query_duration_seconds',
+    'Время запросов Database к MySQL',
+    ('operation',)
+)
+LOOKUPS = Counter(
+    'phone_proxy_lookups',
+    'Поиски номеров: direction real/fake, source index/cache/db, result hit/miss',
+    ('direction', 'source', 'result')
+)
+IMPORT_PHASE_SECONDS = Histogram(
+    'phone_proxy_import_phase_duration_seconds',
+    'Длительность фаз импорта import_worker',
+    ('phase',),
+    buckets=IMPORT_BUCKETS
+)
+IMPORTS = Counter(
+    'phone_proxy_imports',
+    'Импорты файлов по результату',
+    ('result',)
+)
+IMPORT_ROWS = Counter(
+    'phone_proxy_import_rows',
+    'Строк данных прочитано из файлов импорта'
+)
+IMPORT_LAST_SUCCESS = Gauge(
+    'phone_proxy_import_last_success_timestamp_seconds',
+    'Время окончания последнего успешного импорта (unix time)'
+)
+
+
+def db_timer(operation):
+    """Декоратор метода Database: длительность в DB_QUERY_SECONDS"""
+    return DB_QUERY_SECONDS.labels(operation).time()
+
+
+def instrument_app(app):
+    """Время каждого запроса Flask-приложения в HTTP_REQUEST_SECONDS"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            HTTP_REQUEST_SECONDS.labels(
+                request.endpoint or 'unmatched', request.method, str(response.status_code)
+            ).observe(time.perf_counter() - started)
+        return response
+
+    return app
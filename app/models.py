@@ -1,28 +1,51 @@
-import mysql.connector
 from mysql.connector import Error
+from app.cache import notify_mappings_changed
+from app.bulk_loader import get_bulk_loader
+from app.importer import iter_chunks
+from app.metrics import db_timer
+from app.pool import get_pool
 from config import Config
 from datetime import datetime
 
+# Таблицы для импорта с атомарной подменой (RENAME TABLE)
+MAPPINGS_TABLE = 'phone_mappings'
+SHADOW_TABLE = 'phone_mappings_new'
+PREVIOUS_TABLE = 'phone_mappings_old'
+# Рабочая таблица delta-импорта: строки для вставки/замены и удаления
+DELTA_TABLE = 'phone_mappings_delta'
+# Возобновляемый импорт: провалидированные строки файла и контрольные точки
+STAGING_TABLE = 'phone_mappings_staging'
+CHECKPOINTS_TABLE = 'import_checkpoints'
+
+
+def _like_prefix(prefix):
+    """Шаблон LIKE 'prefix%' с экранированием спецсимволов"""
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
 class Database:
     """Класс для работы с MySQL базой данных"""
     
-    def __init__(self):
-        self.config = {
-            'host': Config.MYSQL_HOST,
-            'port': Config.MYSQL_PORT,
-            'user': Config.MYSQL_USER,
-            'password': Config.MYSQL_PASSWORD,
-            'database': Config.MYSQL_DATABASE
-        }
+    def __init__(self, pool=None):
+        # Пул общий для всех экземпляров Database в процессе
+        self.pool = pool or get_pool()
     
     def get_connection(self):
-        """Получить подключение к БД"""
+        """
+        Получить подключение к БД из пула.
+
+        close() у полученного соединения возвращает его в пул.
+        """
         try:
-            connection = mysql.connector.connect(**self.config)
-            return connection
+            return self.pool.acquire()
         except Error as e:
             print(f"Ошибка подключения к MySQL: {e}")
             return None
+
+    def pool_stats(self):
+        """Статистика пула соединений"""
+        return self.pool.stats()
     
     def create_tables(self):
         """Создать таблицы если их нет"""
@@ -41,9 +64,13 @@ class Database:
                     fake_phone VARCHAR(20) NOT NULL UNIQUE,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     INDEX idx_fake_phone (fake_phone),
-                    INDEX idx_real_phone (real_phone)
+                    INDEX idx_real_phone (real_phone),
+                    INDEX idx_created_at (created_at)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
             """)
+            # Индекс постраничного вывода /mappings для таблиц, созданных без него
+            if 'idx_created_at' not in self._secondary_indexes(cursor, MAPPINGS_TABLE):
+                cursor.execute(f"ALTER TABLE {MAPPINGS_TABLE} ADD INDEX idx_created_at (created_at)")
             
             # Таблица логов звонков (опционально)
             cursor.execute("""
@@ -55,6 +82,47 @@ class Database:
                     INDEX idx_fake_phone (fake_phone)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
             """)
+            # Старые установки создавали call_logs с FOREIGN KEY на phone_mappings:
+            # после RENAME TABLE ключ указывал бы на phone_mappings_old
+            self._drop_mapping_foreign_keys(cursor)
+            
+            # Счетчик поколений маппингов: увеличивается при каждом изменении
+            # phone_mappings, по нему кэши всех процессов понимают, что данные устарели
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS mapping_generation (
+                    id TINYINT PRIMARY KEY,
+                    generation BIGINT NOT NULL DEFAULT 0
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            cursor.execute(
+                "INSERT IGNORE INTO mapping_generation (id, generation) VALUES (1, 0)"
+            )
+
+            # Контрольные точки возобновляемого импорта (import_worker.py):
+            # до какой строки и какого байта файл уже записан в staging-таблицу
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                    file_name VARCHAR(255) PRIMARY KEY,
+                    file_size BIGINT NOT NULL,
+                    file_mtime_ns BIGINT NOT NULL,
+                    byte_offset BIGINT NOT NULL DEFAULT 0,
+                    last_row BIGINT NOT NULL DEFAULT 1,
+                    rows_staged BIGINT NOT NULL DEFAULT 0,
+                    stage ENUM('staging', 'staged') NOT NULL DEFAULT 'staging',
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+
+            # Счетчик выдачи фейковых номеров (app/fake_allocator.py)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS fake_allocator (
+                    id TINYINT PRIMARY KEY,
+                    next_counter BIGINT NOT NULL DEFAULT 0
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            cursor.execute(
+                "INSERT IGNORE INTO fake_allocator (id, next_counter) VALUES (1, 0)"
+            )
             
             connection.commit()
             cursor.close()
@@ -64,8 +132,7 @@ class Database:
             print(f"Ошибка создания таблиц: {e}")
             return False
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
     
     def insert_mapping(self, real_phone, fake_phone):
         """Добавить связку номеров"""
@@ -74,47 +141,68 @@ class Database:
             return False
         
         try:
+            connection.start_transaction()
             cursor = connection.cursor()
             cursor.execute(
                 "INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (%s, %s)",
                 (real_phone, fake_phone)
             )
+            self._bump_generation(cursor)
             connection.commit()
             cursor.close()
+            notify_mappings_changed()
             return True
         except Error as e:
             print(f"Ошибка вставки маппинга: {e}")
             return False
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
     
-    def insert_mappings_batch(self, mappings):
-        """Добавить множество связок за раз"""
+    def insert_mappings_batch(self, mappings, loader=None, raise_errors=False):
+        """
+        Добавить множество связок за раз
+
+        Args:
+            mappings: итерируемое кортежей (real_phone, fake_phone)
+            loader: загрузчик ('insert', 'load_data' или экземпляр), по умолчанию Config.BULK_LOADER
+            raise_errors: Пробрасывать ошибки БД вместо возврата False
+                (фоновой загрузке, чтобы повторить порцию при дубле номера)
+        """
         connection = self.get_connection()
         if not connection:
             return False
         
         try:
+            connection.start_transaction()
             cursor = connection.cursor()
-            cursor.executemany(
-                "INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (%s, %s)",
-                mappings
-            )
+            get_bulk_loader(loader).load(cursor, MAPPINGS_TABLE, mappings)
+            self._bump_generation(cursor)
             connection.commit()
             cursor.close()
+            notify_mappings_changed()
             return True
         except Error as e:
+            if raise_errors:
+                raise
             print(f"Ошибка batch вставки: {e}")
             return False
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
     
-    def get_real_phone(self, fake_phone):
-        """Получить реальный номер по фейковому"""
+    @db_timer('get_real_phone')
+    def get_real_phone(self, fake_phone, raise_errors=False):
+        """
+        Получить реальный номер по фейковому
+
+        Args:
+            fake_phone: Фейковый номер
+            raise_errors: Пробрасывать ошибки БД вместо возврата None
+                (нужно кэшу, чтобы не запомнить сбой как "номер не найден")
+        """
         connection = self.get_connection()
         if not connection:
+            if raise_errors:
+                raise Error("Нет подключения к БД")
             return None
         
         try:
@@ -128,11 +216,13 @@ class Database:
             return result[0] if result else None
         except Error as e:
             print(f"Ошибка получения реального номера: {e}")
+            if raise_errors:
+                raise
             return None
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
     
+    @db_timer('get_fake_phone')
     def get_fake_phone(self, real_phone):
         """Получить фейковый номер по реальному"""
         connection = self.get_connection()
@@ -152,8 +242,108 @@ class Database:
             print(f"Ошибка получения фейкового номера: {e}")
             return None
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
+    
+    def _lookup_bulk(self, key_column, value_column, keys, raise_errors=False):
+        """
+        Пакетный поиск по phone_mappings: WHERE key_column IN (...) порциями
+        по Config.BULK_LOOKUP_CHUNK_SIZE через одно соединение
+
+        Args:
+            raise_errors: Пробрасывать ошибки БД вместо возврата {}
+
+        Returns:
+            dict: key -> value для найденных ключей
+        """
+        if not keys:
+            return {}
+        
+        connection = self.get_connection()
+        if not connection:
+            if raise_errors:
+                raise Error("Нет подключения к БД")
+            return {}
+        
+        try:
+            cursor = connection.cursor()
+            found = {}
+            for chunk in iter_chunks(keys, Config.BULK_LOOKUP_CHUNK_SIZE):
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT {key_column}, {value_column} FROM {MAPPINGS_TABLE} "
+                    f"WHERE {key_column} IN ({placeholders})",
+                    chunk
+                )
+                found.update(cursor.fetchall())
+            cursor.close()
+            return found
+        except Error as e:
+            print(f"Ошибка пакетного поиска номеров: {e}")
+            if raise_errors:
+                raise
+            return {}
+        finally:
+            connection.close()
+    
+    @db_timer('get_fake_phones_bulk')
+    def get_fake_phones_bulk(self, real_phones, raise_errors=False):
+        """
+        Получить фейковые номера для множества реальных
+
+        Returns:
+            dict: real_phone -> fake_phone (только существующие)
+        """
+        return self._lookup_bulk('real_phone', 'fake_phone', real_phones, raise_errors)
+    
+    @db_timer('get_real_phones_bulk')
+    def get_real_phones_bulk(self, fake_phones, raise_errors=False):
+        """
+        Получить реальные номера для множества фейковых
+
+        Returns:
+            dict: fake_phone -> real_phone (только существующие)
+        """
+        return self._lookup_bulk('fake_phone', 'real_phone', fake_phones, raise_errors)
+    
+    def existing_fake_phones(self, fake_phones):
+        """
+        Какие из переданных фейковых номеров уже заняты
+
+        Returns:
+            set: занятые номера
+        """
+        return set(self.get_real_phones_bulk(fake_phones))
+    
+    def reserve_fake_counters(self, count):
+        """
+        Атомарно зарезервировать count счетчиков генератора фейковых номеров
+
+        Returns:
+            int|None: первый зарезервированный счетчик
+        """
+        connection = self.get_connection()
+        if not connection:
+            return None
+        
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "UPDATE fake_allocator SET next_counter = LAST_INSERT_ID(next_counter + %s) "
+                "WHERE id = 1",
+                (count,)
+            )
+            if cursor.rowcount != 1:
+                cursor.close()
+                return None
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            end = cursor.fetchone()[0]
+            cursor.close()
+            return end - count
+        except Error as e:
+            print(f"Ошибка резервирования фейковых номеров: {e}")
+            return None
+        finally:
+            connection.close()
     
     def get_all_mappings(self):
         """Получить все связки"""
@@ -171,9 +361,86 @@ class Database:
             print(f"Ошибка получения маппингов: {e}")
             return []
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
+    
+    def get_mappings_page(self, limit, after=None, real_prefix=None, fake_prefix=None):
+        """
+        Страница связок, новые первыми (keyset-пагинация по (created_at, id))
+
+        Следующая страница читается с позиции последней строки предыдущей,
+        поэтому стоимость не растет с номером страницы, как у OFFSET.
+
+        Args:
+            limit: Размер страницы
+            after: (created_at, id) последней строки предыдущей страницы
+            real_prefix: Префикс реального номера
+            fake_prefix: Префикс фейкового номера
+
+        Returns:
+            tuple: (список связок, (created_at, id) для следующей страницы или None)
+        """
+        connection = self.get_connection()
+        if not connection:
+            raise Error("Нет подключения к БД")
+
+        conditions = []
+        params = []
+        if after is not None:
+            # Развернутая форма (created_at, id) < (%s, %s) — диапазон по idx_created_at
+            conditions.append("created_at <= %s AND (created_at < %s OR id < %s)")
+            params.extend((after[0], after[0], after[1]))
+        for column, prefix in (('real_phone', real_prefix), ('fake_phone', fake_prefix)):
+            if prefix:
+                conditions.append(f"{column} LIKE %s")
+                params.append(_like_prefix(prefix))
+
+        sql = f"SELECT id, real_phone, fake_phone, created_at FROM {MAPPINGS_TABLE}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]['created_at'], rows[-1]['id'])
+
+    def estimate_mappings_count(self):
+        """
+        Примерное число связок из статистики InnoDB (без COUNT(*) по таблице)
+
+        Returns:
+            int или None, если статистика недоступна
+        """
+        connection = self.get_connection()
+        if not connection:
+            return None
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                (MAPPINGS_TABLE,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+            return int(row[0]) if row and row[0] is not None else None
+        except Error as e:
+            print(f"Ошибка оценки числа маппингов: {e}")
+            return None
+        finally:
+            connection.close()
     
+    @db_timer('log_call')
     def log_call(self, fake_phone, real_phone):
         """Залогировать звонок"""
         connection = self.get_connection()
@@ -193,8 +460,67 @@ class Database:
             print(f"Ошибка логирования звонка: {e}")
             return False
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
+    
+    @db_timer('log_calls_batch')
+    def log_calls_batch(self, events):
+        """
+        Залогировать пачку звонков одним многострочным INSERT
+
+        Args:
+            events: список кортежей (fake_phone, real_phone, call_timestamp)
+        """
+        if not events:
+            return True
+        
+        connection = self.get_connection()
+        if not connection:
+            return False
+        
+        try:
+            cursor = connection.cursor()
+            placeholders = ", ".join(["(%s, %s, %s)"] * len(events))
+            params = [value for event in events for value in event]
+            cursor.execute(
+                "INSERT INTO call_logs (fake_phone, real_phone, call_timestamp) "
+                f"VALUES {placeholders}",
+                params
+            )
+            connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Ошибка batch логирования звонков: {e}")
+            return False
+        finally:
+            connection.close()
+    
+    @db_timer('get_generation')
+    def get_generation(self):
+        """Текущее поколение маппингов (None при ошибке)"""
+        connection = self.get_connection()
+        if not connection:
+            return None
+        
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT generation FROM mapping_generation WHERE id = 1")
+            result = cursor.fetchone()
+            cursor.close()
+            return result[0] if result else 0
+        except Error as e:
+            print(f"Ошибка получения поколения маппингов: {e}")
+            return None
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _bump_generation(cursor):
+        """Увеличить поколение маппингов в текущей транзакции"""
+        cursor.execute(
+            "INSERT INTO mapping_generation (id, generation) VALUES (1, 1) "
+            "ON DUPLICATE KEY UPDATE generation = generation + 1"
+        )
     
     def clear_all_mappings(self):
         """Очистить все связки номеров"""
@@ -203,24 +529,29 @@ class Database:
             return False
         
         try:
+            connection.start_transaction()
             cursor = connection.cursor()
             cursor.execute("DELETE FROM phone_mappings")
+            self._bump_generation(cursor)
             connection.commit()
             cursor.close()
+            notify_mappings_changed()
             return True
         except Error as e:
             print(f"Ошибка очистки маппингов: {e}")
             return False
         finally:
-            if connection.is_connected():
-                connection.close()
+            connection.close()
 
-    def replace_all_mappings(self, mappings):
+    def replace_all_mappings(self, mappings, chunk_size=None, loader=None):
         """
         Полностью заменить все маппинги на новые данные из файла.
 
         Args:
-            mappings: список кортежей (real_phone, fake_phone)
+            mappings: итерируемое кортежей (real_phone, fake_phone), в том числе
+                генератор — вставляется порциями по chunk_size без материализации
+            chunk_size: размер порции INSERT (по умолчанию Config.IMPORT_CHUNK_SIZE)
+            loader: загрузчик ('insert', 'load_data' или экземпляр), по умолчанию Config.BULK_LOADER
 
         Returns:
             tuple(bool, str|None, int): успех, ошибка (если есть), количество вставок
@@ -233,20 +564,545 @@ class Database:
             connection.start_transaction()
             cursor = connection.cursor()
             cursor.execute("DELETE FROM phone_mappings")
-            if mappings:
-                cursor.executemany(
-                    "INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (%s, %s)",
-                    mappings
-                )
+            inserted = get_bulk_loader(loader, chunk_size).load(
+                cursor, MAPPINGS_TABLE, mappings
+            )
+            self._bump_generation(cursor)
             connection.commit()
-            inserted = len(mappings)
             cursor.close()
+            notify_mappings_changed()
             return True, None, inserted
         except Error as e:
             if connection.is_connected():
                 connection.rollback()
             return False, str(e), 0
         finally:
+            connection.close()
+
+    def swap_replace_mappings(self, mappings, chunk_size=None, loader=None):
+        """
+        Полностью заменить маппинги через теневую таблицу.
+
+        Данные грузятся в phone_mappings_new без вторичных индексов, затем
+        индексы строятся одним ALTER, и таблицы атомарно меняются местами
+        RENAME TABLE. Живая phone_mappings все это время читается без
+        блокировок. Прежние данные остаются в phone_mappings_old до следующего
+        импорта (или удаляются, если IMPORT_KEEP_PREVIOUS_TABLE выключен) —
+        вернуть их можно через rollback_mappings_swap().
+
+        Если на phone_mappings остался внешний ключ (create_tables не смог
+        его снять), импорт выполняется через replace_all_mappings: RENAME
+        перевесил бы ключ на phone_mappings_old.
+
+        Args:
+            mappings: итерируемое кортежей (real_phone, fake_phone)
+            chunk_size: размер порции INSERT (по умолчанию Config.IMPORT_CHUNK_SIZE)
+            loader: загрузчик ('insert', 'load_data' или экземпляр), по умолчанию Config.BULK_LOADER
+
+        Returns:
+            tuple(bool, str|None, int): успех, ошибка (если есть), количество вставок
+        """
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД", 0
+
+        cursor = None
+        try:
+            cursor = connection.cursor()
+            foreign_keys = self._mapping_foreign_keys(cursor)
+            if foreign_keys:
+                print(
+                    f"На {MAPPINGS_TABLE} ссылаются внешние ключи "
+                    f"({', '.join(f'{table}.{name}' for table, name in foreign_keys)}), "
+                    "импорт без подмены таблиц"
+                )
+                cursor.close()
+                cursor = None
+                connection.close()
+                return self.replace_all_mappings(mappings, chunk_size, loader)
+
+            cursor.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+            cursor.execute(f"CREATE TABLE {SHADOW_TABLE} LIKE {MAPPINGS_TABLE}")
+
+            # Вторичные индексы снимаем на время загрузки и строим после
+            indexes = self._secondary_indexes(cursor, SHADOW_TABLE)
+            if indexes:
+                cursor.execute(
+                    f"ALTER TABLE {SHADOW_TABLE} "
+                    + ", ".join(f"DROP INDEX `{name}`" for name in indexes)
+                )
+
+            inserted = get_bulk_loader(loader, chunk_size).load(
+                cursor, SHADOW_TABLE, mappings
+            )
+
+            if indexes:
+                cursor.execute(
+                    f"ALTER TABLE {SHADOW_TABLE} "
+                    + ", ".join(
+                        f"ADD {'UNIQUE ' if unique else ''}INDEX `{name}` ("
+                        + ", ".join(f"`{column}`" for column in columns) + ")"
+                        for name, (unique, columns) in indexes.items()
+                    )
+                )
+
+            cursor.execute(f"DROP TABLE IF EXISTS {PREVIOUS_TABLE}")
+            cursor.execute(
+                f"RENAME TABLE {MAPPINGS_TABLE} TO {PREVIOUS_TABLE}, "
+                f"{SHADOW_TABLE} TO {MAPPINGS_TABLE}"
+            )
+            if not Config.IMPORT_KEEP_PREVIOUS_TABLE:
+                cursor.execute(f"DROP TABLE IF EXISTS {PREVIOUS_TABLE}")
+
+            self._bump_generation(cursor)
+            cursor.close()
+            notify_mappings_changed()
+            return True, None, inserted
+        except Error as e:
+            # Живая таблица не тронута — просто убираем недогруженную теневую
+            try:
+                if cursor is not None and connection.is_connected():
+                    cursor.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+            except Error:
+                pass
+            return False, str(e), 0
+        finally:
+            connection.close()
+
+    def rollback_mappings_swap(self):
+        """
+        Вернуть маппинги, действовавшие до последнего импорта с подменой таблиц.
+
+        Таблицы phone_mappings и phone_mappings_old атомарно меняются местами,
+        поэтому повторный вызов возвращает данные последнего импорта.
+
+        Returns:
+            tuple(bool, str|None): успех, ошибка (если есть)
+        """
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД"
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                (PREVIOUS_TABLE,)
+            )
+            if not cursor.fetchone()[0]:
+                cursor.close()
+                return False, f"Таблица {PREVIOUS_TABLE} не найдена"
+
+            cursor.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+            cursor.execute(
+                f"RENAME TABLE {MAPPINGS_TABLE} TO {SHADOW_TABLE}, "
+                f"{PREVIOUS_TABLE} TO {MAPPINGS_TABLE}, "
+                f"{SHADOW_TABLE} TO {PREVIOUS_TABLE}"
+            )
+            self._bump_generation(cursor)
+            cursor.close()
+            notify_mappings_changed()
+            return True, None
+        except Error as e:
+            return False, str(e)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _mapping_foreign_keys(cursor):
+        """
+        Внешние ключи других таблиц на phone_mappings (и ее теневые копии)
+
+        Returns:
+            list: (таблица, имя ограничения)
+        """
+        tables = (MAPPINGS_TABLE, SHADOW_TABLE, PREVIOUS_TABLE)
+        cursor.execute(
+            "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+            "WHERE CONSTRAINT_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IN (%s, %s, %s)",
+            tables
+        )
+        return [(table, name) for table, name in cursor.fetchall() if table not in tables]
+
+    def _drop_mapping_foreign_keys(self, cursor):
+        """Снять внешние ключи на phone_mappings, мешающие импорту с подменой таблиц"""
+        try:
+            foreign_keys = self._mapping_foreign_keys(cursor)
+            for table, name in foreign_keys:
+                cursor.execute(f"ALTER TABLE `{table}` DROP FOREIGN KEY `{name}`")
+                print(f"Снят внешний ключ {table}.{name} на {MAPPINGS_TABLE}")
+        except Error as e:
+            # Без прав на ALTER импорт с подменой откатится на replace
+            print(f"Не удалось снять внешние ключи на {MAPPINGS_TABLE}: {e}")
+
+    @staticmethod
+    def _secondary_indexes(cursor, table):
+        """
+        Вторичные индексы таблицы.
+
+        Returns:
+            dict: имя индекса -> (уникальный ли, [колонки по порядку])
+        """
+        cursor.execute(f"SHOW INDEX FROM {table}")
+        columns = [d[0] for d in cursor.description]
+        indexes = {}
+        for row in cursor.fetchall():
+            info = dict(zip(columns, row))
+            name = info['Key_name']
+            if name == 'PRIMARY':
+                continue
+            unique, cols = indexes.setdefault(name, (not info['Non_unique'], []))
+            cols.append((info['Seq_in_index'], info['Column_name']))
+        return {
+            name: (unique, [column for _, column in sorted(cols)])
+            for name, (unique, cols) in indexes.items()
+        }
+
+    def iter_mappings(self, columns=('real_phone', 'fake_phone'), order_by=None, batch_size=None):
+        """
+        Потоково читать phone_mappings через небуферизованный (server-side) курсор.
+
+        Строки не накапливаются в памяти: соединение удерживается до конца
+        итерации и возвращается в пул, когда генератор исчерпан или закрыт.
+
+        Yields:
+            tuple: значения колонок columns
+        """
+        batch_size = batch_size or Config.IMPORT_CHUNK_SIZE
+        connection = self.get_connection()
+        if not connection:
+            raise Error("Нет подключения к БД")
+
+        cursor = None
+        exhausted = False
+        try:
+            cursor = connection.cursor(buffered=False)
+            sql = f"SELECT {', '.join(columns)} FROM {MAPPINGS_TABLE}"
+            if order_by:
+                sql += f" ORDER BY {order_by}"
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            exhausted = True
+        finally:
+            if not exhausted:
+                # Итерацию прервали (клиент закрыл загрузку, ошибка) — недочитанный
+                # результат не должен остаться в соединении из пула
+                connection.discard()
+            else:
+                try:
+                    if cursor is not None:
+                        cursor.close()
+                except Error:
+                    pass
+                connection.close()
+
+    def apply_mappings_delta(self, mappings, keep_real, chunk_size=None):
+        """
+        Привести phone_mappings к новому набору, записав только разницу.
+
+        1. Входящие маппинги порциями сверяются с таблицей (WHERE real_phone IN),
+           новые и изменившиеся складываются в phone_mappings_delta.
+        2. Таблица читается потоково, real_phone, для которых keep_real вернул
+           False, помечаются к удалению там же.
+        3. В одной транзакции удаляются изменившиеся и исчезнувшие строки
+           и вставляются новые значения.
+
+        Изменившаяся строка удаляется и вставляется заново — так обмен
+        fake_phone между двумя real_phone не нарушает UNIQUE.
+
+        Args:
+            mappings: итерируемое кортежей (real_phone, fake_phone) без дублей
+            keep_real: функция real_phone -> bool, остается ли номер в наборе
+                (вызывается после того, как mappings полностью прочитаны)
+            chunk_size: размер порции (по умолчанию Config.IMPORT_CHUNK_SIZE)
+
+        Returns:
+            tuple(bool, str|None, dict): успех, ошибка, счетчики
+                added / changed / removed / unchanged
+        """
+        chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+        counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД", counts
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {DELTA_TABLE}")
+            cursor.execute(f"""
+                CREATE TABLE {DELTA_TABLE} (
+                    real_phone VARCHAR(20) NOT NULL PRIMARY KEY,
+                    fake_phone VARCHAR(64) NULL,
+                    op ENUM('upsert', 'delete') NOT NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+
+            # 1. Новые и изменившиеся маппинги
+            for chunk in iter_chunks(mappings, chunk_size):
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"SELECT real_phone, fake_phone FROM {MAPPINGS_TABLE} "
+                    f"WHERE real_phone IN ({placeholders})",
+                    [real_phone for real_phone, _ in chunk]
+                )
+                existing = dict(cursor.fetchall())
+
+                upserts = []
+                for real_phone, fake_phone in chunk:
+                    current = existing.get(real_phone)
+                    if current is None:
+                        counts['added'] += 1
+                    elif current != fake_phone:
+                        counts['changed'] += 1
+                    else:
+                        counts['unchanged'] += 1
+                        continue
+                    upserts.append((real_phone, fake_phone))
+
+                if upserts:
+                    cursor.executemany(
+                        f"INSERT INTO {DELTA_TABLE} (real_phone, fake_phone, op) "
+                        "VALUES (%s, %s, 'upsert')",
+                        upserts
+                    )
+
+            # 2. Исчезнувшие номера
+            removed = (
+                (real_phone,)
+                for (real_phone,) in self.iter_mappings(columns=('real_phone',))
+                if not keep_real(real_phone)
+            )
+            for chunk in iter_chunks(removed, chunk_size):
+                cursor.executemany(
+                    f"INSERT INTO {DELTA_TABLE} (real_phone, op) VALUES (%s, 'delete')",
+                    chunk
+                )
+                counts['removed'] += len(chunk)
+
+            # 3. Применение разницы одной транзакцией
+            if counts['added'] or counts['changed'] or counts['removed']:
+                connection.start_transaction()
+                cursor.execute(
+                    f"DELETE m FROM {MAPPINGS_TABLE} m "
+                    f"JOIN {DELTA_TABLE} d ON d.real_phone = m.real_phone"
+                )
+                cursor.execute(
+                    f"INSERT INTO {MAPPINGS_TABLE} (real_phone, fake_phone) "
+                    f"SELECT real_phone, fake_phone FROM {DELTA_TABLE} WHERE op = 'upsert'"
+                )
+                self._bump_generation(cursor)
+                connection.commit()
+                notify_mappings_changed()
+
+            cursor.execute(f"DROP TABLE IF EXISTS {DELTA_TABLE}")
+            cursor.close()
+            return True, None, counts
+        except Error as e:
+            if connection.is_connected() and connection.in_transaction:
+                connection.rollback()
+            return False, str(e), counts
+        finally:
+            connection.close()
+
+    def get_import_checkpoint(self, file_name):
+        """
+        Контрольная точка импорта файла
+
+        Returns:
+            dict|None: file_size, file_mtime_ns, byte_offset, last_row,
+                rows_staged, stage; None если точки нет или БД недоступна
+        """
+        connection = self.get_connection()
+        if not connection:
+            return None
+
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT file_size, file_mtime_ns, byte_offset, last_row, rows_staged, stage "
+                f"FROM {CHECKPOINTS_TABLE} WHERE file_name = %s",
+                (file_name,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+        except Error as e:
+            print(f"Ошибка чтения контрольной точки импорта: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def start_import_staging(self, file_name, file_size, file_mtime_ns):
+        """
+        Начать импорт файла заново: пустая staging-таблица и новая контрольная точка
+
+        Returns:
+            tuple(bool, str|None): успех, ошибка
+        """
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД"
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            # Индексы для дедупликации строятся после загрузки (finish_import_staging)
+            cursor.execute(f"""
+                CREATE TABLE {STAGING_TABLE} (
+                    pos BIGINT PRIMARY KEY,
+                    real_phone VARCHAR(20) NOT NULL,
+                    fake_phone VARCHAR(64) NOT NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            cursor.execute(f"DELETE FROM {CHECKPOINTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {CHECKPOINTS_TABLE} (file_name, file_size, file_mtime_ns) "
+                "VALUES (%s, %s, %s)",
+                (file_name, file_size, file_mtime_ns)
+            )
+            cursor.close()
+            return True, None
+        except Error as e:
+            return False, str(e)
+        finally:
+            connection.close()
+
+    def stage_mappings_chunk(self, file_name, rows, byte_offset, last_row, chunk_size=None):
+        """
+        Записать порцию строк файла в staging-таблицу вместе с контрольной точкой
+
+        Строки и новая точка фиксируются одной транзакцией: после падения
+        процесса импорт продолжается ровно с первой незаписанной строки.
+
+        Args:
+            rows: список (номер строки, real_phone, fake_phone)
+            byte_offset: смещение в файле после последней строки порции
+            last_row: номер последней строки порции
+
+        Returns:
+            tuple(bool, str|None): успех, ошибка
+        """
+        chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД"
+
+        try:
+            connection.start_transaction()
+            cursor = connection.cursor()
+            for chunk in iter_chunks(rows, chunk_size):
+                placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+                cursor.execute(
+                    f"INSERT INTO {STAGING_TABLE} (pos, real_phone, fake_phone) VALUES {placeholders}",
+                    [value for row in chunk for value in row]
+                )
+            cursor.execute(
+                f"UPDATE {CHECKPOINTS_TABLE} SET byte_offset = %s, last_row = %s, "
+                "rows_staged = rows_staged + %s WHERE file_name = %s",
+                (byte_offset, last_row, len(rows), file_name)
+            )
+            connection.commit()
+            cursor.close()
+            return True, None
+        except Error as e:
             if connection.is_connected():
+                connection.rollback()
+            return False, str(e)
+        finally:
+            connection.close()
+
+    def finish_import_staging(self, file_name):
+        """
+        Завершить загрузку файла в staging: индексы для дедупликации
+
+        Returns:
+            tuple(bool, str|None): успех, ошибка
+        """
+        connection = self.get_connection()
+        if not connection:
+            return False, "Нет подключения к БД"
+
+        try:
+            cursor = connection.cursor()
+            # После падения между ALTER и обновлением точки индексы уже есть
+            existing = self._secondary_indexes(cursor, STAGING_TABLE)
+            missing = [
+                f"ADD INDEX `{name}` (`{column}`, `pos`)"
+                for name, column in (('idx_real_pos', 'real_phone'), ('idx_fake_pos', 'fake_phone'))
+                if name not in existing
+            ]
+            if missing:
+                cursor.execute(f"ALTER TABLE {STAGING_TABLE} " + ", ".join(missing))
+            cursor.execute(
+                f"UPDATE {CHECKPOINTS_TABLE} SET stage = 'staged' WHERE file_name = %s",
+                (file_name,)
+            )
+            connection.commit()
+            cursor.close()
+            return True, None
+        except Error as e:
+            return False, str(e)
+        finally:
+            connection.close()
+
+    def iter_staged_survivors(self, batch_size=None):
+        """
+        Итоговые маппинги staging-таблицы в порядке строк файла.
+
+        Дедупликация в SQL по правилу файла импорта (как MappingDeduper):
+        строка остается, если она последняя и для своего real_phone,
+        и для своего fake_phone. Читается небуферизованным курсором.
+
+        Yields:
+            tuple(str, str): (real_phone, fake_phone)
+        """
+        batch_size = batch_size or Config.IMPORT_CHUNK_SIZE
+        connection = self.get_connection()
+        if not connection:
+            raise Error("Нет подключения к БД")
+
+        exhausted = False
+        try:
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(f"""
+                SELECT s.real_phone, s.fake_phone FROM {STAGING_TABLE} s
+                WHERE s.pos = (SELECT MAX(r.pos) FROM {STAGING_TABLE} r WHERE r.real_phone = s.real_phone)
+                  AND s.pos = (SELECT MAX(f.pos) FROM {STAGING_TABLE} f WHERE f.fake_phone = s.fake_phone)
+                ORDER BY s.pos
+            """)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+            exhausted = True
+        finally:
+            if exhausted:
                 connection.close()
+            else:
+                connection.discard()
 
+    def clear_import_checkpoint(self, file_name):
+        """Удалить контрольную точку и staging-таблицу после завершения импорта"""
+        connection = self.get_connection()
+        if not connection:
+            return False
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DELETE FROM {CHECKPOINTS_TABLE} WHERE file_name = %s", (file_name,))
+            connection.commit()
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Ошибка удаления контрольной точки импорта: {e}")
+            return False
+        finally:
+            connection.close()
@@ -0,0 +1,264 @@
+import os
+import time
+from collections import deque
+from threading import Condition, Lock
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import Config
+
+
+class PoolExhausted(Error):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class PooledConnection:
+    """
+    Обёртка над соединением из пула.
+
+    Ведёт себя как обычное соединение mysql.connector, но close()
+    возвращает соединение в пул вместо разрыва TCP-сессии. close() нужно
+    вызывать всегда, даже после потери связи: иначе место в пуле не
+    освобождается, а разорванное соединение release() сам выбросит.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def is_connected(self):
+        # После возврата в пул обёртка считается закрытой
+        if self._released:
+            return False
+        return self._raw.is_connected()
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw)
+
+    def discard(self):
+        """
+        Разорвать соединение вместо возврата в пул.
+
+        Нужно, когда на соединении остался недочитанный небуферизованный
+        результат: дочитывать миллионы строк дольше, чем переподключиться.
+        """
+        if self._released:
+            return
+        try:
+            self._raw.shutdown()
+        except Exception:
+            pass
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Пул соединений с MySQL.
+
+    - размер пула ограничен MYSQL_POOL_SIZE, при нехватке соединений
+      checkout ждёт до MYSQL_POOL_TIMEOUT секунд;
+    - простаивающее дольше MYSQL_POOL_PING_INTERVAL соединение перед выдачей
+      проверяется ping с переподключением;
+    - соединения старше MYSQL_POOL_RECYCLE пересоздаются.
+    """
+
+    def __init__(self, db_config, size, timeout, ping_interval, recycle):
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.recycle = recycle
+
+        self._cond = Condition(Lock())
+        # (raw_connection, last_used_at), время создания — в _meta
+        self._idle = deque()
+        self._meta = {}
+        self._in_use = 0
+
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'reconnected': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'errors': 0,
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config)
+        self._meta[id(raw)] = time.monotonic()
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    def _discard(self, raw):
+        self._meta.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+
+    def _check(self, raw, last_used):
+        """Проверить соединение перед выдачей, при необходимости переподключить"""
+        now = time.monotonic()
+        created = self._meta.get(id(raw), now)
+
+        if self.recycle and now - created > self.recycle:
+            self._discard(raw)
+            return self._connect()
+
+        if now - last_used < self.ping_interval:
+            return raw
+
+        try:
+            raw.ping(reconnect=False)
+            return raw
+        except Error:
+            # Сокет устарел (wait_timeout, рестарт MySQL) — пересоздаём
+            self._discard(raw)
+            with self._cond:
+                self._stats['reconnected'] += 1
+            return self._connect()
+
+    def acquire(self):
+        """Получить соединение из пула (PooledConnection)"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                self._stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._in_use >= self.size:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhausted(
+                            f"Пул соединений исчерпан ({self.size}) за {self.timeout}с"
+                        )
+            self._in_use += 1
+            item = self._idle.pop() if self._idle else None
+
+        try:
+            if item is None:
+                raw = self._connect()
+            else:
+                raw, last_used = item
+                raw = self._check(raw, last_used)
+                with self._cond:
+                    self._stats['reused'] += 1
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._stats['errors'] += 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """Вернуть соединение в пул (вызывается из PooledConnection.close)"""
+        healthy = True
+        try:
+            if raw.is_connected():
+                # Незавершённая транзакция не должна переехать к следующему
+                # пользователю вместе с соединением
+                if raw.in_transaction:
+                    raw.rollback()
+            else:
+                healthy = False
+        except Error:
+            healthy = False
+
+        if not healthy:
+            self._discard(raw)
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        """Статистика использования пула"""
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        return data
+
+    def close_all(self):
+        """Закрыть все простаивающие соединения"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+
+
+def get_pool():
+    """
+    Общий пул соединений процесса.
+
+    Используется и Flask-приложением (run.py), и import_worker.py.
+    После fork (gunicorn) каждый процесс создаёт собственный пул.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            # mysql.connector требует, чтобы каталог LOCAL INFILE существовал
+            os.makedirs(Config.BULK_LOAD_TMP_DIR, exist_ok=True)
+            _pool = ConnectionPool(
+                db_config={
+                    'host': Config.MYSQL_HOST,
+                    'port': Config.MYSQL_PORT,
+                    'user': Config.MYSQL_USER,
+                    'password': Config.MYSQL_PASSWORD,
+                    'database': Config.MYSQL_DATABASE,
+                    'connection_timeout': Config.MYSQL_CONNECT_TIMEOUT,
+                    # Чтения не открывают транзакцию и не держат снимок данных;
+                    # явные транзакции по-прежнему через start_transaction()
+                    'autocommit': True,
+                    # LOAD DATA LOCAL INFILE разрешен только для временных
+                    # файлов загрузчика (app/bulk_loader.py)
+                    'allow_local_infile_in_path': Config.BULK_LOAD_TMP_DIR,
+                },
+                size=Config.MYSQL_POOL_SIZE,
+                timeout=Config.MYSQL_POOL_TIMEOUT,
+                ping_interval=Config.MYSQL_POOL_PING_INTERVAL,
+                recycle=Config.MYSQL_POOL_RECYCLE,
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def current_pool():
+    """Пул этого процесса, если он уже создан (без создания нового)"""
+    pool = _pool
+    return pool if pool is not None and _pool_pid == os.getpid() else None
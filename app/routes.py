@@ -1,16 +1,26 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, session, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, send_file, session, redirect, url_for, Response, stream_with_context
 from functools import wraps
-from werkzeug.utils import secure_filename
+from itertools import chain, islice
+import base64
+import csv
+import json
 import os
+import zlib
 from app.models import Database
+from app.cache import GenerationWatcher, LookupCache
+from app.bulk_loader import BULK_LOADERS
+from app.importer import iter_chunks
+from app.call_log import CallLogWriter
+from app.fake_allocator import FakePhoneAllocator
+from app.jobs import JOB_ID_RE, UploadJobManager, UploadJobStore
+from app.mapping_index import LiveMappingIndex
+from app import metrics
+from app.snapshot import SnapshotReader
 from app.utils import (
-    generate_fake_phone, 
-    parse_csv_phones, 
     allowed_file,
     normalize_phone
 )
 from config import Config
-import io
 
 bp = Blueprint('main', __name__)
 db = Database()
@@ -18,6 +28,95 @@ db = Database()
 # Инициализация БД при старте
 db.create_tables()
 
+# Кэш fake -> real для /lookup/real, сбрасывается при смене поколения маппингов
+generation_watcher = GenerationWatcher(
+    lambda: db.get_generation(),
+    Config.LOOKUP_CACHE_GENERATION_CHECK
+)
+real_phone_cache = LookupCache(
+    lambda fake_phone: db.get_real_phone(fake_phone, raise_errors=True),
+    generation_watcher,
+    max_size=Config.LOOKUP_CACHE_SIZE,
+    ttl=Config.LOOKUP_CACHE_TTL,
+    negative_ttl=Config.LOOKUP_CACHE_NEGATIVE_TTL,
+    bulk_loader=lambda fake_phones: db.get_real_phones_bulk(fake_phones, raise_errors=True)
+)
+
+# Компактная копия phone_mappings для /lookup (обе стороны): индекс в памяти
+# процесса или общий mmap-снимок import_worker; пока индекс строится или
+# устарел, поиск идет в MySQL
+if not Config.LOOKUP_INDEX_ENABLED:
+    mapping_index = None
+elif Config.LOOKUP_INDEX_SOURCE == 'snapshot':
+    mapping_index = SnapshotReader(
+        Config.SNAPSHOT_PATH,
+        Config.SNAPSHOT_CHECK_INTERVAL,
+        generation_watcher
+    )
+else:
+    mapping_index = LiveMappingIndex(
+        lambda: db.iter_mappings(),
+        lambda: db.get_generation(),
+        generation_watcher,
+        rebuild_delay=Config.LOOKUP_INDEX_REBUILD_DELAY
+    )
+
+
+def current_mapping_index():
+    """Индекс текущего поколения маппингов или None"""
+    return mapping_index.current() if mapping_index is not None else None
+
+
+# Выдача фейковых номеров без проверки по всей таблице
+fake_allocator = FakePhoneAllocator(db)
+
+# Фоновая обработка /upload; состояние заданий в файлах, видно всем воркерам
+upload_jobs = UploadJobManager(
+    db,
+    fake_allocator,
+    UploadJobStore(os.path.join(Config.UPLOAD_FOLDER, 'jobs')),
+    workers=Config.UPLOAD_JOB_WORKERS,
+    chunk_size=Config.UPLOAD_JOB_CHUNK_SIZE
+)
+
+# Логи звонков пишутся пачками в фоне, не задерживая ответ Asterisk
+call_log_writer = CallLogWriter(
+    db,
+    queue_size=Config.CALL_LOG_QUEUE_SIZE,
+    batch_size=Config.CALL_LOG_BATCH_SIZE,
+    flush_interval=Config.CALL_LOG_FLUSH_INTERVAL
+)
+
+# Статистика компонентов в /metrics читается на момент запроса
+metrics.REGISTRY.add_collector(lambda: metrics.stats_families(
+    'phone_proxy_lookup_cache', real_phone_cache.stats(),
+    counters=('hits', 'negative_hits', 'misses', 'evictions', 'invalidations'),
+    gauges=('size', 'max_size'),
+    documentation='Кэш /lookup/real'
+))
+metrics.REGISTRY.add_collector(lambda: metrics.stats_families(
+    'phone_proxy_mapping_index', mapping_index.stats() if mapping_index is not None else {},
+    counters=('builds', 'build_errors', 'loads', 'load_errors'),
+    gauges=('entries', 'bytes'),
+    documentation='Индекс маппингов процесса'
+))
+metrics.REGISTRY.add_collector(lambda: metrics.stats_families(
+    'phone_proxy_call_log', call_log_writer.stats(),
+    counters=('enqueued', 'dropped', 'written', 'failed', 'batches'),
+    gauges=('queue_depth', 'queue_size'),
+    documentation='Фоновая запись логов звонков'
+))
+
+
+def _count_lookups(direction, source, results):
+    """Попадания и промахи пакетного поиска в LOOKUPS"""
+    found = sum(1 for value in results.values() if value)
+    if found:
+        metrics.LOOKUPS.labels(direction, source, 'hit').inc(found)
+    if len(results) > found:
+        metrics.LOOKUPS.labels(direction, source, 'miss').inc(len(results) - found)
+    return results
+
 # Простая авторизация
 USERNAME = 'admin'
 PASSWORD = 'finenumbers2025'
@@ -65,10 +164,10 @@ def index():
 @login_required
 def upload_file():
     """
-    Загрузить CSV файл с номерами и сгенерировать фейковые
+    Загрузить CSV файл с номерами и поставить в очередь генерацию фейковых
     
     Returns:
-        JSON с фейковыми номерами или ошибкой
+        JSON с идентификатором задания (202) или ошибкой
     """
     # Проверка наличия файла
     if 'file' not in request.files:
@@ -86,100 +185,173 @@ def upload_file():
         # Проверяем флаг очистки базы
         clear_old = request.form.get('clear_old', 'false').lower() == 'true'
         
-        # Сохраняем файл
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        
-        # Парсим номера из CSV
-        real_phones = parse_csv_phones(filepath)
+        # Способ записи в БД: insert или load_data
+        loader = request.form.get('loader') or Config.UPLOAD_BULK_LOADER
+        if loader not in BULK_LOADERS:
+            return jsonify({'error': f'Неизвестный загрузчик: {loader}'}), 400
         
-        if not real_phones:
-            os.remove(filepath)
-            return jsonify({'error': 'В файле не найдено валидных номеров'}), 400
-        
-        # Если нужно, очищаем базу
-        if clear_old:
-            db.clear_all_mappings()
-            existing_fake_phones = set()
-            existing_real_phones = set()
-        else:
-            # Получаем существующие фейковые номера для проверки уникальности
-            existing_mappings = db.get_all_mappings()
-            existing_fake_phones = {m['fake_phone'] for m in existing_mappings}
-            existing_real_phones = {m['real_phone'] for m in existing_mappings}
-        
-        # Генерируем фейковые номера
-        mappings = []
-        results = []
-        
-        for real_phone in real_phones:
-            # Проверяем что реальный номер еще не добавлен
-            if real_phone in existing_real_phones:
-                # Получаем существующий фейковый номер
-                fake_phone = db.get_fake_phone(real_phone)
-                results.append({
-                    'real_phone': real_phone,
-                    'fake_phone': fake_phone,
-                    'status': 'existing'
-                })
-                continue
-            
-            # Генерируем новый фейковый номер
-            fake_phone = generate_fake_phone(existing_fake_phones)
-            existing_fake_phones.add(fake_phone)
-            
-            mappings.append((real_phone, fake_phone))
-            results.append({
-                'real_phone': real_phone,
-                'fake_phone': fake_phone,
-                'status': 'new'
-            })
-        
-        # Сохраняем новые маппинги в БД
-        if mappings:
-            success = db.insert_mappings_batch(mappings)
-            if not success:
-                os.remove(filepath)
-                return jsonify({'error': 'Ошибка сохранения в базу данных'}), 500
-        
-        # Удаляем загруженный файл
-        os.remove(filepath)
+        # Файл сохраняется, обработка идет в фоне; прогресс — GET /jobs/<job_id>
+        job_id = upload_jobs.submit(file, clear_old, loader)
         
         return jsonify({
             'success': True,
-            'total': len(results),
-            'new': len(mappings),
-            'existing': len(results) - len(mappings),
-            'mappings': results
-        })
+            'job_id': job_id,
+            'status_url': url_for('main.job_status', job_id=job_id),
+            'result_url': url_for('main.job_result', job_id=job_id)
+        }), 202
     
     except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
         return jsonify({'error': f'Ошибка обработки файла: {str(e)}'}), 500
 
 
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """
+    Статус фоновой загрузки
+    
+    Returns:
+        JSON: status (queued, parsing, running, done, failed), rows_total,
+        rows_done, throughput_rows_sec, eta_sec, new, existing, error
+    """
+    job = upload_jobs.store.get(job_id) if JOB_ID_RE.match(job_id) else None
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    job = upload_jobs.store.fail_if_orphaned(job)
+    return jsonify(dict(job, success=True))
+
+
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def job_result(job_id):
+    """
+    Результат загрузки
+    
+    Query:
+        format: csv (real_phone,fake_phone,status — по умолчанию),
+                fake (только фейковые номера построчно),
+                json (первые limit связок для показа на странице)
+    """
+    job = upload_jobs.store.get(job_id) if JOB_ID_RE.match(job_id) else None
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Задание еще не завершено', 'status': job['status']}), 409
+    
+    result_path = upload_jobs.store.result_path(job_id)
+    fmt = request.args.get('format', 'csv')
+    
+    if fmt == 'json':
+        limit = min(request.args.get('limit', 1000, type=int), 10000)
+        with open(result_path, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            mappings = list(islice(reader, limit))
+        return jsonify({
+            'success': True,
+            'total': job['total'],
+            'mappings': mappings
+        })
+    
+    if fmt == 'fake':
+        def generate():
+            with open(result_path, encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    yield row[1] + '\n'
+        
+        return Response(
+            generate(),
+            mimetype='text/plain',
+            headers={'Content-Disposition': 'attachment; filename=fake_phones.txt'}
+        )
+    
+    return send_file(
+        os.path.abspath(result_path),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name='phone_mappings_upload.csv'
+    )
+
+
+def _encode_cursor(position):
+    """Курсор страницы: (created_at, id) последней строки в base64"""
+    created_at, mapping_id = position
+    raw = json.dumps([str(created_at), mapping_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    created_at, mapping_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return str(created_at), int(mapping_id)
+
+
 @bp.route('/mappings', methods=['GET'])
 @login_required
 def get_mappings():
     """
-    Получить все существующие связки
+    Получить страницу связок, новые первыми
+    
+    Query:
+        limit: размер страницы (до MAPPINGS_PAGE_MAX)
+        cursor: next_cursor из предыдущего ответа
+        real, fake: префикс реального/фейкового номера
     
     Returns:
-        JSON со списком всех маппингов
+        JSON со страницей маппингов, next_cursor и примерным общим числом
     """
     try:
-        mappings = db.get_all_mappings()
+        limit = request.args.get('limit', Config.MAPPINGS_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, Config.MAPPINGS_PAGE_MAX))
+        
+        cursor = request.args.get('cursor')
+        try:
+            after = _decode_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Некорректный cursor'}), 400
+        
+        real_prefix = normalize_phone(request.args.get('real', ''))
+        fake_prefix = normalize_phone(request.args.get('fake', ''))
+        
+        mappings, next_position = db.get_mappings_page(
+            limit, after=after, real_prefix=real_prefix, fake_prefix=fake_prefix
+        )
+        
         return jsonify({
             'success': True,
             'count': len(mappings),
-            'mappings': mappings
+            'mappings': mappings,
+            'next_cursor': _encode_cursor(next_position) if next_position else None,
+            # Оценка по статистике InnoDB; с фильтрами не считается
+            'total_estimate': (
+                None if real_prefix or fake_prefix or after else db.estimate_mappings_count()
+            )
         })
     except Exception as e:
         return jsonify({'error': f'Ошибка получения данных: {str(e)}'}), 500
 
 
+def resolve_real_phone(fake_phone):
+    """
+    Реальный номер по нормализованному фейковому с логированием звонка
+    
+    Общая часть /lookup/real и короткого пути для Asterisk (app/asterisk.py).
+    Ошибки БД пробрасываются.
+    """
+    index = current_mapping_index()
+    if index is not None:
+        real_phone = index.get_real(fake_phone)
+        source = 'index'
+    else:
+        real_phone = real_phone_cache.get(fake_phone)
+        source = 'cache'
+    metrics.LOOKUPS.labels('real', source, 'hit' if real_phone else 'miss').inc()
+    if real_phone:
+        # Логируем звонок (асинхронно)
+        call_log_writer.log(fake_phone, real_phone)
+    return real_phone
+
+
 @bp.route('/lookup/real/<fake_phone>', methods=['GET'])
 def lookup_real(fake_phone):
     """
@@ -192,13 +364,9 @@ def lookup_real(fake_phone):
         JSON с реальным номером
     """
     try:
-        normalized = normalize_phone(fake_phone)
-        real_phone = db.get_real_phone(normalized)
+        real_phone = resolve_real_phone(normalize_phone(fake_phone))
         
         if real_phone:
-            # Логируем звонок
-            db.log_call(normalized, real_phone)
-            
             return jsonify({
                 'success': True,
                 'real_phone': real_phone
@@ -226,7 +394,14 @@ def lookup_fake(real_phone):
     """
     try:
         normalized = normalize_phone(real_phone)
-        fake_phone = db.get_fake_phone(normalized)
+        index = current_mapping_index()
+        if index is not None:
+            fake_phone = index.get_fake(normalized)
+            source = 'index'
+        else:
+            fake_phone = db.get_fake_phone(normalized)
+            source = 'db'
+        metrics.LOOKUPS.labels('fake', source, 'hit' if fake_phone else 'miss').inc()
         
         if fake_phone:
             return jsonify({
@@ -243,35 +418,163 @@ def lookup_fake(real_phone):
         return jsonify({'error': f'Ошибка: {str(e)}'}), 500
 
 
+def _read_ndjson_phones():
+    """Номера из тела NDJSON: по одному на строку, JSON-строкой или как есть"""
+    for line in request.stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(b'"'):
+            yield json.loads(line)
+        else:
+            yield line.decode('utf-8')
+
+
+def _batch_lookup(resolve, value_key):
+    """
+    Общая часть /lookup/real/batch и /lookup/fake/batch
+
+    JSON: {"phones": [...]} (или просто список) не больше LOOKUP_BATCH_MAX
+    номеров -> {"results": {номер: найденный номер или null}}.
+    NDJSON (Content-Type: application/x-ndjson): номера построчно без
+    ограничения количества, ответ — строка JSON на каждый номер по мере
+    обработки порций BULK_LOOKUP_CHUNK_SIZE.
+
+    resolve(list) -> dict нормализованный номер -> значение или None
+    """
+    if request.mimetype == 'application/x-ndjson':
+        def generate():
+            for chunk in iter_chunks(_read_ndjson_phones(), Config.BULK_LOOKUP_CHUNK_SIZE):
+                normalized = [normalize_phone(phone) for phone in chunk]
+                found = resolve(list({phone for phone in normalized if phone}))
+                for phone, key in zip(chunk, normalized):
+                    yield json.dumps({'phone': phone, value_key: found.get(key)}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    data = request.get_json(silent=True)
+    phones = data.get('phones') if isinstance(data, dict) else data
+    if not isinstance(phones, list):
+        return jsonify({'error': 'Ожидается JSON {"phones": [...]}'}), 400
+    if len(phones) > Config.LOOKUP_BATCH_MAX:
+        return jsonify({
+            'error': f'Не больше {Config.LOOKUP_BATCH_MAX} номеров за запрос, '
+                     f'для больших пакетов используйте application/x-ndjson'
+        }), 413
+
+    normalized = {normalize_phone(phone) for phone in phones}
+    invalid = '' in normalized
+    normalized.discard('')
+    results = resolve(list(normalized))
+    found = sum(1 for value in results.values() if value)
+
+    return jsonify({
+        'success': True,
+        'count': len(normalized),
+        'found': found,
+        'invalid': invalid,
+        'results': results
+    })
+
+
+@bp.route('/lookup/real/batch', methods=['POST'])
+def lookup_real_batch():
+    """
+    Пакетный поиск реальных номеров по фейковым (сверка CDR, синхронизация CRM)
+    
+    Идет через индекс в памяти или кэш /lookup/real, промахи кэша — одним
+    WHERE fake_phone IN (...). Звонки не логируются.
+    """
+    def resolve(fake_phones):
+        index = current_mapping_index()
+        if index is not None:
+            return _count_lookups(
+                'real', 'index', {phone: index.get_real(phone) for phone in fake_phones}
+            )
+        return _count_lookups('real', 'cache', real_phone_cache.get_many(fake_phones))
+    
+    try:
+        return _batch_lookup(resolve, 'real_phone')
+    except Exception as e:
+        return jsonify({'error': f'Ошибка: {str(e)}'}), 500
+
+
+@bp.route('/lookup/fake/batch', methods=['POST'])
+def lookup_fake_batch():
+    """Пакетный поиск фейковых номеров по реальным"""
+    def resolve(real_phones):
+        index = current_mapping_index()
+        if index is not None:
+            return _count_lookups(
+                'fake', 'index', {phone: index.get_fake(phone) for phone in real_phones}
+            )
+        found = db.get_fake_phones_bulk(real_phones, raise_errors=True)
+        return _count_lookups('fake', 'db', {phone: found.get(phone) for phone in real_phones})
+    
+    try:
+        return _batch_lookup(resolve, 'fake_phone')
+    except Exception as e:
+        return jsonify({'error': f'Ошибка: {str(e)}'}), 500
+
+
 @bp.route('/export/csv', methods=['GET'])
 def export_csv():
     """
-    Экспортировать все маппинги в CSV
+    Экспортировать все маппинги в CSV потоком
+    
+    Строки читаются небуферизованным курсором и отдаются порциями по мере
+    поступления, поэтому память не зависит от размера таблицы.
+    
+    Query:
+        gzip: 1 — сжимать на лету (phone_mappings.csv.gz)
     
     Returns:
         CSV файл для скачивания
     """
     try:
-        mappings = db.get_all_mappings()
-        
-        # Создаем CSV в памяти
-        output = io.StringIO()
-        output.write('Real Phone,Fake Phone,Created At\n')
-        
-        for mapping in mappings:
-            output.write(f"{mapping['real_phone']},{mapping['fake_phone']},{mapping['created_at']}\n")
+        compress = request.args.get('gzip', '0').lower() in ('1', 'true')
         
-        # Создаем response
-        output.seek(0)
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='phone_mappings.csv'
+        # Порядок по первичному ключу не требует сортировки всей таблицы
+        rows = db.iter_mappings(
+            columns=('real_phone', 'fake_phone', 'created_at'),
+            order_by='id',
+            batch_size=Config.EXPORT_BATCH_ROWS
         )
-    
+        # Первая строка читается до начала ответа: ошибка БД вернется как 500
+        first = next(rows, None)
     except Exception as e:
         return jsonify({'error': f'Ошибка экспорта: {str(e)}'}), 500
+    
+    def generate_csv():
+        yield 'Real Phone,Fake Phone,Created At\n'
+        if first is None:
+            return
+        for chunk in iter_chunks(chain((first,), rows), Config.EXPORT_BATCH_ROWS):
+            yield ''.join(
+                f"{real_phone},{fake_phone},{created_at}\n"
+                for real_phone, fake_phone, created_at in chunk
+            )
+    
+    def generate_gzip():
+        # wbits=31 — формат gzip
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for text in generate_csv():
+            data = compressor.compress(text.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+    
+    if compress:
+        return Response(
+            generate_gzip(),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': 'attachment; filename=phone_mappings.csv.gz'}
+        )
+    return Response(
+        (text.encode('utf-8') for text in generate_csv()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=phone_mappings.csv'}
+    )
 
 
 @bp.route('/clear', methods=['POST'])
@@ -305,13 +608,29 @@ def clear_all():
 def health():
     """Health check endpoint"""
     try:
-        # Проверяем подключение к БД
+        # Проверяем подключение к БД (соединение берется из пула)
         connection = db.get_connection()
         if connection:
             connection.close()
-            return jsonify({'status': 'healthy', 'database': 'connected'})
+            return jsonify({
+                'status': 'healthy',
+                'database': 'connected',
+                'pool': db.pool_stats(),
+                'lookup_cache': real_phone_cache.stats(),
+                'mapping_index': mapping_index.stats() if mapping_index is not None else None,
+                'call_log': call_log_writer.stats()
+            })
         else:
-            return jsonify({'status': 'unhealthy', 'database': 'disconnected'}), 503
+            return jsonify({
+                'status': 'unhealthy',
+                'database': 'disconnected',
+                'pool': db.pool_stats()
+            }), 503
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 503
 
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
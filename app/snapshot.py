@@ -0,0 +1,191 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from threading import Lock
+
+from app.mapping_index import MappingIndex
+
+
+# Формат файла снимка phone_mappings (все числа little-endian):
+#
+#   заголовок 64 байта: magic, версия формата, поколение маппингов,
+#       число упакованных связок N, смещение и длина overflow, время создания
+#   [N записей (fake u64, real u64), по возрастанию fake]
+#   [N записей (real u64, fake u64), по возрастанию real]
+#   overflow: JSON [[real, fake], ...] для неупаковываемых номеров
+#
+# Номера упакованы как в app/mapping_index.py (int("1" + digits)).
+MAGIC = b'PMSNAP\x00\x00'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sIIqQQQd8x')
+HEADER_SIZE = 64
+RECORD_SIZE = 16
+
+assert _HEADER.size == HEADER_SIZE
+
+
+class SnapshotError(Exception):
+    """Файл снимка поврежден или несовместим"""
+
+
+def _interleave(keys, values):
+    records = array('Q', bytes(RECORD_SIZE * len(keys)))
+    records[0::2] = keys
+    records[1::2] = values
+    if sys.byteorder != 'little':
+        records.byteswap()
+    return records
+
+
+def write_snapshot(path, rows, generation):
+    """
+    Построить снимок из пар (real_phone, fake_phone) и атомарно опубликовать
+
+    Файл пишется рядом во временный, синхронизируется на диск и подменяет
+    старый через os.replace: читатели видят либо старую, либо новую версию.
+
+    Returns:
+        dict: generation, entries, bytes
+    """
+    index = MappingIndex.from_rows(rows, generation)
+    fake_keys, real_values, real_keys, fake_values, fake_overflow = index.arrays()
+    count = len(fake_keys)
+    overflow = json.dumps(
+        [[real, fake] for fake, real in fake_overflow.items()], ensure_ascii=False
+    ).encode('utf-8')
+    overflow_offset = HEADER_SIZE + 2 * RECORD_SIZE * count
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(
+                MAGIC, FORMAT_VERSION, 0, generation, count,
+                overflow_offset, len(overflow), time.time()
+            ))
+            _interleave(fake_keys, real_values).tofile(f)
+            _interleave(real_keys, fake_values).tofile(f)
+            f.write(overflow)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {'generation': generation, 'entries': len(index), 'bytes': overflow_offset + len(overflow)}
+
+
+def open_snapshot(path):
+    """
+    Отобразить файл снимка в память и вернуть MappingIndex поверх него
+
+    Записи не копируются: ключи и значения — срезы memoryview над mmap,
+    страницы общие для всех процессов через page cache.
+    """
+    if sys.byteorder != 'little':
+        raise SnapshotError("Снимок поддерживается только на little-endian")
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER_SIZE:
+            raise SnapshotError(f"Файл снимка слишком короткий: {size} байт")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, _, generation, count, overflow_offset, overflow_size, _ = \
+        _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Неизвестный формат файла снимка")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Неподдерживаемая версия снимка: {version}")
+    if overflow_offset != HEADER_SIZE + 2 * RECORD_SIZE * count or \
+            overflow_offset + overflow_size != size:
+        raise SnapshotError("Размер файла снимка не совпадает с заголовком")
+
+    values = memoryview(mapped)[HEADER_SIZE:overflow_offset].cast('Q')
+    by_fake = values[:2 * count]
+    by_real = values[2 * count:]
+
+    fake_overflow = {}
+    real_overflow = {}
+    for real_phone, fake_phone in json.loads(bytes(mapped[overflow_offset:size]) or b'[]'):
+        fake_overflow[fake_phone] = real_phone
+        real_overflow[real_phone] = fake_phone
+
+    return MappingIndex(
+        by_fake[0::2], by_fake[1::2], by_real[0::2], by_real[1::2],
+        fake_overflow, real_overflow, generation
+    )
+
+
+class SnapshotReader:
+    """
+    Текущий снимок для процесса с горячей подменой.
+
+    Файл проверяется (stat) не чаще check_interval секунд; при смене inode
+    или mtime новая версия открывается и подменяет ссылку. Старое
+    отображение освобождается, когда его перестают использовать запросы.
+
+    С watcher снимок отдается, только если его поколение совпадает с
+    текущим поколением маппингов (после /upload или ручных правок снимок
+    устаревает до следующего импорта).
+    """
+
+    def __init__(self, path, check_interval, watcher=None):
+        self.path = path
+        self.check_interval = check_interval
+        self._watcher = watcher
+        self._lock = Lock()
+        self._index = None
+        self._stat_key = None
+        self._checked_at = 0.0
+        self._stats = {'loads': 0, 'load_errors': 0}
+
+    def current(self):
+        """MappingIndex последнего опубликованного снимка или None"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._refresh()
+        index = self._index
+        if index is not None and self._watcher is not None \
+                and index.generation != self._watcher.current():
+            return None
+        return index
+
+    def _refresh(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._index = None
+                self._stat_key = None
+                return
+            stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat_key == self._stat_key:
+                return
+            try:
+                self._index = open_snapshot(self.path)
+                self._stats['loads'] += 1
+            except (OSError, ValueError, SnapshotError) as e:
+                print(f"Ошибка открытия снимка {self.path}: {e}")
+                self._stats['load_errors'] += 1
+            self._stat_key = stat_key
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        index = self._index
+        data = dict(self._stats)
+        data.update({
+            'path': self.path,
+            'generation': index.generation if index is not None else None,
+            'entries': len(index) if index is not None else 0,
+        })
+        return data
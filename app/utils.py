@@ -1,37 +1,8 @@
-import random
-import string
-from config import Config
-
-def generate_fake_phone(existing_phones=None):
-    """
-    Генерировать уникальный фейковый телефонный номер
-    
-    Args:
-        existing_phones: Список уже существующих номеров для проверки уникальности
-    
-    Returns:
-        str: 15-значный номер
-    """
-    if existing_phones is None:
-        existing_phones = set()
-    
-    length = Config.FAKE_NUMBER_LENGTH
-    prefix = Config.FAKE_NUMBER_PREFIX
-    
-    # Длина оставшейся части номера
-    remaining_length = length - len(prefix)
-    
-    max_attempts = 1000
-    for _ in range(max_attempts):
-        # Генерируем случайные цифры
-        random_part = ''.join(random.choices(string.digits, k=remaining_length))
-        fake_phone = prefix + random_part
-        
-        if fake_phone not in existing_phones:
-            return fake_phone
-    
-    raise ValueError(f"Не удалось сгенерировать уникальный номер после {max_attempts} попыток")
+import os
+from collections import namedtuple
+from itertools import islice
 
+from config import Config
 
 def normalize_phone(phone):
     """
@@ -46,6 +17,57 @@ def normalize_phone(phone):
     return ''.join(filter(str.isdigit, str(phone)))
 
 
+# Пакетная нормализация: колонка склеивается через разделитель и за один
+# вызов bytes.translate из нее удаляется все, кроме ASCII-цифр
+_BATCH_SEPARATOR = '\n'
+_NON_DIGIT_BYTES = bytes(
+    b for b in range(256) if not (48 <= b <= 57) and b != ord(_BATCH_SEPARATOR)
+)
+PHONE_BATCH_SIZE = 50000
+
+PhoneBatch = namedtuple('PhoneBatch', ['normalized', 'valid', 'errors'])
+
+
+def normalize_phones(phones):
+    """
+    Нормализовать колонку номеров — результат совпадает с normalize_phone
+
+    ASCII-порции обрабатываются целиком через bytes.translate; порции с
+    не-ASCII символами (str.isdigit принимает и другие цифры Unicode) или
+    с разделителем внутри значения — поштучно через normalize_phone.
+
+    Returns:
+        list: нормализованные номера в том же порядке
+    """
+    result = []
+    for start in range(0, len(phones), PHONE_BATCH_SIZE):
+        chunk = [str(phone) for phone in phones[start:start + PHONE_BATCH_SIZE]]
+        joined = _BATCH_SEPARATOR.join(chunk)
+        if joined.isascii():
+            parts = joined.encode('ascii').translate(None, _NON_DIGIT_BYTES).split(b'\n')
+            if len(parts) == len(chunk):
+                result.extend(part.decode('ascii') for part in parts)
+                continue
+        result.extend(normalize_phone(phone) for phone in chunk)
+    return result
+
+
+def validate_phones(phones):
+    """
+    Нормализовать и валидировать колонку номеров за один проход
+
+    Правила те же, что у validate_phone: после нормализации от 10 до 15 цифр.
+
+    Returns:
+        PhoneBatch: normalized — нормализованные номера, valid — маска
+        валидности, errors — индексы невалидных элементов
+    """
+    normalized = normalize_phones(phones)
+    valid = [10 <= len(phone) <= 15 for phone in normalized]
+    errors = [idx for idx, ok in enumerate(valid) if not ok]
+    return PhoneBatch(normalized, valid, errors)
+
+
 def validate_phone(phone):
     """
     Валидация телефонного номера
@@ -79,32 +101,28 @@ def parse_csv_phones(file_path):
     Returns:
         list: Список валидных номеров
     """
-    phones = []
+    phones = set()
     
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Убираем пробелы и переносы строк
-                phone = line.strip()
-                
-                if not phone:
-                    continue
+            while True:
+                # Убираем пробелы и переносы строк, пустые строки пропускаем
+                lines = [line.strip() for line in islice(f, PHONE_BATCH_SIZE)]
+                if not lines:
+                    break
                 
-                # Нормализуем номер
-                normalized = normalize_phone(phone)
-                
-                # Валидируем
-                if validate_phone(normalized):
-                    phones.append(normalized)
+                # Нормализуем и валидируем порцией
+                batch = validate_phones([line for line in lines if line])
+                phones.update(
+                    phone for phone, ok in zip(batch.normalized, batch.valid) if ok
+                )
     
     except Exception as e:
         print(f"Ошибка чтения CSV: {e}")
         return []
     
-    # Убираем дубликаты
-    phones = list(set(phones))
-    
-    return phones
+    # Без дубликатов
+    return list(phones)
 
 
 def allowed_file(filename):
@@ -120,3 +138,14 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+
+def pid_alive(pid):
+    """Жив ли процесс с этим pid на текущем хосте"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
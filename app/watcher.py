@@ -0,0 +1,154 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+
+# Константы <sys/inotify.h> (Linux)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class InotifyUnavailable(OSError):
+    """inotify не поддерживается системой или не удалось создать наблюдение"""
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError) as e:
+        raise InotifyUnavailable(f"inotify недоступен: {e}")
+
+
+class DirectoryWatcher:
+    """
+    Ожидание новых файлов в каталоге через inotify (ctypes, без зависимостей).
+
+    Файл считается готовым по IN_CLOSE_WRITE (писатель закрыл файл) или
+    IN_MOVED_TO (файл переложен в каталог rename). wait() возвращается,
+    когда после готового файла прошло debounce секунд без событий по
+    подходящим файлам, поэтому набор файлов, записываемых подряд,
+    обрабатывается одним сканированием. Файл, в который еще пишут
+    (IN_MODIFY без IN_CLOSE_WRITE), не будит воркер; такие имена лежат в
+    writing и между вызовами wait(), их сканирование каталога пропускает
+    (wait() мог вернуться по таймауту или по другому файлу).
+
+    match(name) отбирает интересные имена: события по .processing,
+    маркерам и прочим файлам игнорируются.
+    """
+
+    def __init__(self, directory, match, debounce):
+        self.directory = str(directory)
+        self.match = match
+        self.debounce = debounce
+        # Файлы, в которые еще пишут: IN_MODIFY без последующего закрытия
+        self.writing = set()
+
+        libc = _load_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise InotifyUnavailable(error, f"inotify_init1: {os.strerror(error)}")
+        wd = libc.inotify_add_watch(
+            fd, os.fsencode(self.directory),
+            IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY | IN_MOVED_FROM | IN_DELETE
+        )
+        if wd < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise InotifyUnavailable(error, f"inotify_add_watch {self.directory}: {os.strerror(error)}")
+        self._fd = fd
+
+    def read_events(self, timeout):
+        """
+        Прочитать накопившиеся события, ожидая не дольше timeout секунд
+
+        Returns:
+            list: (mask, имя файла)
+        """
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def wait(self, timeout):
+        """
+        Ждать готовых файлов не дольше timeout секунд
+
+        Returns:
+            bool: True — есть новые файлы (или события потеряны при
+            переполнении очереди), False — истек timeout
+
+        Raises:
+            OSError: каталог удален или наблюдение снято (IN_IGNORED)
+        """
+        deadline = time.monotonic() + timeout
+        ready = False
+        writing = self.writing
+        last_event = None
+
+        while True:
+            now = time.monotonic()
+            if last_event is not None and now - last_event < self.debounce:
+                wait_time = last_event + self.debounce - now
+            elif ready and not writing:
+                return True
+            elif now >= deadline:
+                return ready
+            else:
+                wait_time = deadline - now
+
+            for mask, name in self.read_events(wait_time):
+                if mask & IN_IGNORED:
+                    raise OSError(errno.ENOENT, f"Наблюдение за {self.directory} снято")
+                if mask & IN_Q_OVERFLOW:
+                    # Очередь событий переполнена — проверяем каталог целиком
+                    ready = True
+                    continue
+                if not self.match(name):
+                    continue
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    # Файл забран воркером или удален — писать в него уже некому
+                    writing.discard(name)
+                    continue
+                last_event = time.monotonic()
+                if mask & IN_MODIFY:
+                    writing.add(name)
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    writing.discard(name)
+                    ready = True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк импорта номеров: ImportWorker.process_file, parse_csv_phones и /upload.
+
+Для каждого размера генерируется синтетический файл, каждый замер идет
+в отдельном процессе (чтобы пиковый RSS относился только к нему), вместо
+MySQL используется SQLite в памяти (benchmarks/standin.py).
+
+Пример:
+    python -m benchmarks.bench_import --sizes 10000,1000000 --output bench_import.json
+    python -m benchmarks.bench_import --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.gen_csv import generate_csv
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+TARGETS = ("worker", "parse", "upload")
+# Формат входного файла для каждой цели
+TARGET_FORMATS = {"worker": "ggs", "parse": "plain", "upload": "plain"}
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(path, options):
+    """ImportWorker.process_file с SQLite вместо MySQL"""
+    workdir = Path(tempfile.mkdtemp(prefix="bench_worker_"))
+    os.environ["INCOMING_DIR"] = str(workdir / "incoming")
+    os.environ["ARCHIVE_DIR"] = str(workdir / "archive")
+
+    import import_worker
+    from benchmarks.standin import SqliteDatabase
+
+    import_worker.Database = SqliteDatabase
+    worker = import_worker.ImportWorker(import_worker.ImportState())
+    worker.max_file_bytes = float("inf")
+    if options.get("mode"):
+        worker.import_mode = options["mode"]
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    result = worker.process_file(Path(path))
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_sec": elapsed,
+        "db_write_sec": worker.db.write_time,
+        "baseline_rss_mb": baseline,
+        "rows_written": result["inserted"],
+        "mode": result["mode"],
+    }
+
+
+def run_parse(path, options):
+    """parse_csv_phones (без БД)"""
+    from app.utils import parse_csv_phones
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    phones = parse_csv_phones(path)
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_sec": elapsed,
+        "db_write_sec": 0.0,
+        "baseline_rss_mb": baseline,
+        "rows_written": len(phones),
+    }
+
+
+def run_upload(path, options):
+    """POST /upload и ожидание фонового задания (тестовый клиент Flask, SQLite вместо MySQL)"""
+    from config import Config
+
+    Config.UPLOAD_FOLDER = tempfile.mkdtemp(prefix="bench_upload_")
+
+    from app import create_app, routes
+    from benchmarks.standin import SqliteDatabase, install_in_routes
+
+    db = SqliteDatabase()
+    install_in_routes(routes, db)
+
+    app = create_app()
+    app.config["MAX_CONTENT_LENGTH"] = None
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        response = client.post(
+            "/upload",
+            data={"file": (f, "phones.csv"), "clear_old": "true"},
+            content_type="multipart/form-data",
+        )
+    if response.status_code != 202:
+        raise RuntimeError(f"/upload вернул {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    # Ждем завершения фонового задания
+    status_url = response.get_json()["status_url"]
+    while True:
+        job = client.get(status_url).get_json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    if job["status"] != "done":
+        raise RuntimeError(f"Задание загрузки завершилось ошибкой: {job.get('error')}")
+    return {
+        "elapsed_sec": elapsed,
+        "db_write_sec": db.write_time,
+        "baseline_rss_mb": baseline,
+        "rows_written": job.get("new", 0),
+        "response_bytes": len(response.get_data()),
+    }
+
+
+RUNNERS = {"worker": run_worker, "parse": run_parse, "upload": run_upload}
+
+
+def run_single(target, rows, path, options):
+    """Выполнить один замер в текущем процессе и вернуть результат"""
+    result = RUNNERS[target](path, options)
+    result.update({
+        "target": target,
+        "rows": rows,
+        "file_bytes": os.path.getsize(path),
+        "rows_per_sec": rows / result["elapsed_sec"] if result["elapsed_sec"] else None,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+
+def ensure_file(workdir, rows, fmt):
+    path = Path(workdir) / f"phones_{fmt}_{rows}.csv"
+    if not path.exists():
+        print(f"Генерация {path}...", file=sys.stderr)
+        generate_csv(path, rows, fmt)
+    return path
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run_suite(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    targets = args.targets.split(",")
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = []
+    for rows in sizes:
+        for target in targets:
+            path = ensure_file(args.workdir, rows, TARGET_FORMATS[target])
+            cmd = [
+                sys.executable, "-m", "benchmarks.bench_import",
+                "--single", target, "--rows", str(rows), "--file", str(path),
+            ]
+            if args.mode:
+                cmd += ["--mode", args.mode]
+            print(f"{target} @ {rows} строк...", file=sys.stderr)
+            proc = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+            if proc.returncode != 0:
+                results.append({"target": target, "rows": rows, "error": proc.stderr.strip()[-2000:]})
+                print(f"  ошибка: {proc.stderr.strip()[-500:]}", file=sys.stderr)
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f"  {result['rows_per_sec']:.0f} строк/с, peak RSS {result['peak_rss_mb']:.1f} MB, "
+                f"запись в БД {result['db_write_sec']:.2f} с",
+                file=sys.stderr,
+            )
+
+    report = {
+        "benchmark": "import",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+def compare(old_path, new_path):
+    """Сравнить два отчета: изменение rows/sec и peak RSS по (target, rows)"""
+    def load(path):
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        return report, {(r["target"], r["rows"]): r for r in report["results"] if "error" not in r}
+
+    old_report, old = load(old_path)
+    new_report, new = load(new_path)
+    print(f"{old_report.get('git_revision')} -> {new_report.get('git_revision')}")
+    print(f"{'target':8} {'rows':>10} {'rows/s old':>12} {'rows/s new':>12} {'Δ%':>7} {'RSS old':>9} {'RSS new':>9}")
+    for key in sorted(set(old) & set(new)):
+        o, n = old[key], new[key]
+        delta = (n["rows_per_sec"] / o["rows_per_sec"] - 1) * 100 if o["rows_per_sec"] else 0
+        print(
+            f"{key[0]:8} {key[1]:>10} {o['rows_per_sec']:>12.0f} {n['rows_per_sec']:>12.0f} "
+            f"{delta:>+7.1f} {o['peak_rss_mb']:>9.1f} {n['peak_rss_mb']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--mode", choices=("swap", "replace", "delta"), help="IMPORT_MODE для worker")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "phone_proxy_bench"))
+    parser.add_argument("--output", help="файл для JSON отчета")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два JSON отчета")
+    # Внутренний режим: один замер в дочернем процессе
+    parser.add_argument("--single", choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.single:
+        result = run_single(args.single, args.rows, args.file, {"mode": args.mode})
+        # Последняя строка stdout — результат для родительского процесса
+        print(json.dumps(result))
+    else:
+        run_suite(args)
+
+
+if __name__ == "__main__":
+    main()
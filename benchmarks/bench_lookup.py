@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест /lookup/real, /lookup/fake и /asterisk/lookup/real.
+
+По умолчанию поднимает Flask-приложение в отдельном процессе с SQLite
+вместо MySQL (benchmarks/standin.py), заполненной --mappings связками
+в нумерации benchmarks/gen_csv.py. С --url бьет во внешний сервер —
+его БД должна быть загружена файлом из gen_csv с тем же числом строк.
+
+Пример:
+    python -m benchmarks.bench_lookup --concurrency 16 --requests 50000 \
+        --hit-ratio 0.95 --distribution hotset --output bench_lookup.json
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from threading import Lock, Thread
+from urllib.parse import urlsplit
+
+from benchmarks.bench_import import git_revision
+from benchmarks.gen_csv import fake_phone, real_phone
+
+
+PERCENTILES = (50, 95, 99, 99.9)
+# Путь и направление поиска: asterisk — text/plain путь в обход Flask
+ENDPOINT_PATHS = {
+    "real": "/lookup/real",
+    "fake": "/lookup/fake",
+    "asterisk": "/asterisk/lookup/real",
+}
+
+
+def serve(mappings, ready):
+    """Процесс сервера: Flask + SQLite с mappings связками"""
+    from werkzeug.serving import make_server
+
+    from config import Config
+
+    Config.UPLOAD_FOLDER = tempfile.mkdtemp(prefix="bench_lookup_")
+
+    from app import create_app, routes
+    from benchmarks.standin import SqliteDatabase, install_in_routes
+
+    db = SqliteDatabase()
+    db.insert_mappings_batch((real_phone(i), fake_phone(i)) for i in range(mappings))
+    install_in_routes(routes, db)
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+class KeyPicker:
+    """Выбор номера для запроса: доля попаданий и распределение ключей"""
+
+    def __init__(self, mappings, hit_ratio, distribution, hot_fraction, hot_traffic, seed):
+        self.mappings = mappings
+        self.hit_ratio = hit_ratio
+        self.distribution = distribution
+        self.hot_size = max(1, int(mappings * hot_fraction))
+        self.hot_traffic = hot_traffic
+        self.rnd = random.Random(seed)
+
+    def pick(self):
+        rnd = self.rnd
+        if not self.mappings or rnd.random() >= self.hit_ratio:
+            # Промах: номер за пределами загруженного диапазона
+            return False, self.mappings + rnd.randrange(10 ** 6)
+        if self.distribution == "hotset" and rnd.random() < self.hot_traffic:
+            return True, rnd.randrange(self.hot_size)
+        return True, rnd.randrange(self.mappings)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_load(args, host, port, path_prefix):
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    lock = Lock()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    per_thread = args.requests // args.concurrency if not deadline else None
+
+    endpoints = ("real", "fake") if args.endpoint == "both" else (args.endpoint,)
+
+    def worker(n):
+        picker = KeyPicker(args.mappings, args.hit_ratio, args.distribution,
+                           args.hot_fraction, args.hot_traffic, args.seed + n)
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        local_latencies = []
+        local_statuses = Counter()
+        local_errors = Counter()
+        done = 0
+        while (deadline and time.monotonic() < deadline) or (per_thread and done < per_thread):
+            _, key = picker.pick()
+            endpoint = endpoints[done % len(endpoints)]
+            number = real_phone(key) if endpoint == "fake" else fake_phone(key)
+            started = time.perf_counter()
+            try:
+                conn.request("GET", f"{path_prefix}{ENDPOINT_PATHS[endpoint]}/{number}")
+                response = conn.getresponse()
+                response.read()
+                local_statuses[response.status] += 1
+            except Exception as e:
+                local_errors[type(e).__name__] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+                done += 1
+                continue
+            local_latencies.append(time.perf_counter() - started)
+            done += 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+
+    threads = [Thread(target=worker, args=(n,)) for n in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + sum(errors.values())
+    return {
+        "requests": total,
+        "elapsed_sec": elapsed,
+        "requests_per_sec": total / elapsed if elapsed else None,
+        "latency_ms": {
+            f"p{p:g}": percentile(latencies, p) * 1000 if latencies else None
+            for p in PERCENTILES
+        } | {
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            "max": latencies[-1] * 1000 if latencies else None,
+        },
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "errors": dict(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="внешний сервер, например http://127.0.0.1:3000")
+    parser.add_argument("--mappings", type=int, default=100_000, help="количество связок в БД")
+    parser.add_argument("--endpoint", choices=tuple(ENDPOINT_PATHS) + ("both",), default="real")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20_000, help="всего запросов (если не задан --duration)")
+    parser.add_argument("--duration", type=float, help="длительность теста в секундах")
+    parser.add_argument("--hit-ratio", type=float, default=0.9, help="доля запросов к существующим номерам")
+    parser.add_argument("--distribution", choices=("uniform", "hotset"), default="uniform")
+    parser.add_argument("--hot-fraction", type=float, default=0.01, help="доля номеров в горячем наборе")
+    parser.add_argument("--hot-traffic", type=float, default=0.9, help="доля попаданий в горячий набор")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл для JSON отчета")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip("/")
+    else:
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(args.mappings, ready), daemon=True)
+        server.start()
+        host, port, prefix = "127.0.0.1", ready.get(timeout=300), ""
+
+    try:
+        print(f"Нагрузка на http://{host}:{port}{prefix} ({args.endpoint}) ...", file=sys.stderr)
+        result = run_load(args, host, port, prefix)
+    finally:
+        if server is not None:
+            server.terminate()
+
+    report = {
+        "benchmark": "lookup",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            key: getattr(args, key)
+            for key in ("url", "mappings", "endpoint", "concurrency", "requests", "duration",
+                        "hit_ratio", "distribution", "hot_fraction", "hot_traffic", "seed")
+        },
+        "result": result,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетических файлов номеров для бенчмарков.
+
+Форматы:
+    ggs   — как GGS_all_phones.csv: заголовок, "real_phone;fake_phone"
+    plain — как файл для /upload: один реальный номер на строку
+
+Пример:
+    python -m benchmarks.gen_csv --rows 1000000 --output /tmp/GGS_all_phones.csv
+"""
+import argparse
+import random
+
+
+def real_phone(n):
+    """Детерминированный 11-значный реальный номер по порядковому номеру"""
+    return f"79{n:09d}"
+
+
+def fake_phone(n):
+    """Детерминированный 15-значный фейковый номер по порядковому номеру"""
+    return f"7{n:014d}"
+
+
+def generate_csv(path, rows, fmt="ggs", dup_ratio=0.01, seed=42):
+    """
+    Записать файл с rows строками.
+
+    Args:
+        path: путь к файлу
+        rows: количество строк данных
+        fmt: 'ggs' или 'plain'
+        dup_ratio: доля строк, повторяющих ранее встреченный real_phone
+            (проверяет дедупликацию)
+        seed: зерно генератора случайных чисел
+
+    Returns:
+        int: размер файла в байтах
+    """
+    rnd = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "ggs":
+            f.write("real_phone;fake_phone\n")
+        for i in range(rows):
+            if i and rnd.random() < dup_ratio:
+                real = real_phone(rnd.randrange(i))
+            else:
+                real = real_phone(i)
+            if fmt == "ggs":
+                line = f"{real};{fake_phone(i)}\n"
+            else:
+                # Немного "грязного" форматирования, как в реальных выгрузках
+                line = f"+{real[0]} {real[1:4]} {real[4:7]}-{real[7:9]}-{real[9:]}\n" \
+                    if i % 10 == 0 else f"{real}\n"
+            f.write(line)
+        written = f.tell()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--format", choices=("ggs", "plain"), default="ggs")
+    parser.add_argument("--dup-ratio", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    size = generate_csv(args.output, args.rows, args.format, args.dup_ratio, args.seed)
+    print(f"{args.output}: {args.rows} строк, {size} байт")
+
+
+if __name__ == "__main__":
+    main()
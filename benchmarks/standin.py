@@ -0,0 +1,353 @@
+"""
+SQLite-замена app.models.Database для бенчмарков без сервера MySQL.
+
+Повторяет публичные методы Database (сигнатуры и формат результатов),
+поэтому подставляется вместо него в ImportWorker и в routes. Все
+обращения сериализуются одной блокировкой, время методов записи
+накапливается в write_time.
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from threading import RLock
+
+from mysql.connector import IntegrityError
+
+from app.bulk_loader import ER_DUP_ENTRY
+from app.cache import notify_mappings_changed
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Connection:
+    """Минимальный аналог соединения для /health"""
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class SqliteDatabase:
+    """Database поверх SQLite (по умолчанию в памяти)"""
+
+    def __init__(self, path=":memory:", chunk_size=10000):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=MEMORY")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.chunk_size = chunk_size
+        self.lock = RLock()
+        self.generation = 0
+        self.write_time = 0.0
+        self.fake_counter = 0
+        self.create_tables()
+
+    @contextmanager
+    def _write(self):
+        started = time.perf_counter()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.generation += 1
+            self.conn.execute("COMMIT")
+        self.write_time += time.perf_counter() - started
+        notify_mappings_changed()
+
+    # Соединение и служебное
+
+    def get_connection(self):
+        return _Connection()
+
+    def pool_stats(self):
+        return {'size': 1, 'in_use': 0, 'idle': 1}
+
+    def get_generation(self):
+        return self.generation
+
+    def reserve_fake_counters(self, count):
+        with self.lock:
+            start = self.fake_counter
+            self.fake_counter += count
+        return start
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS phone_mappings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    real_phone TEXT NOT NULL UNIQUE,
+                    fake_phone TEXT NOT NULL UNIQUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE TABLE IF NOT EXISTS import_checkpoints (
+                    file_name TEXT PRIMARY KEY,
+                    file_size INTEGER NOT NULL,
+                    file_mtime_ns INTEGER NOT NULL,
+                    byte_offset INTEGER NOT NULL DEFAULT 0,
+                    last_row INTEGER NOT NULL DEFAULT 1,
+                    rows_staged INTEGER NOT NULL DEFAULT 0,
+                    stage TEXT NOT NULL DEFAULT 'staging'
+                );
+                CREATE TABLE IF NOT EXISTS call_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fake_phone TEXT NOT NULL,
+                    real_phone TEXT NOT NULL,
+                    call_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+        return True
+
+    # Запись
+
+    def insert_mapping(self, real_phone, fake_phone):
+        return self.insert_mappings_batch([(real_phone, fake_phone)])
+
+    def insert_mappings_batch(self, mappings, loader=None, raise_errors=False):
+        try:
+            with self._write() as conn:
+                for chunk in _chunks(mappings, self.chunk_size):
+                    conn.executemany(
+                        "INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (?, ?)", chunk
+                    )
+            return True
+        except sqlite3.IntegrityError as e:
+            if raise_errors:
+                raise IntegrityError(msg=str(e), errno=ER_DUP_ENTRY)
+            print(f"Ошибка batch вставки: {e}")
+            return False
+        except sqlite3.Error as e:
+            print(f"Ошибка batch вставки: {e}")
+            return False
+
+    def replace_all_mappings(self, mappings, chunk_size=None, loader=None):
+        try:
+            inserted = 0
+            with self._write() as conn:
+                conn.execute("DELETE FROM phone_mappings")
+                for chunk in _chunks(mappings, chunk_size or self.chunk_size):
+                    conn.executemany(
+                        "INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (?, ?)", chunk
+                    )
+                    inserted += len(chunk)
+            return True, None, inserted
+        except sqlite3.Error as e:
+            return False, str(e), 0
+
+    # В SQLite нет RENAME нескольких таблиц одной командой — замена в транзакции
+    swap_replace_mappings = replace_all_mappings
+
+    def rollback_mappings_swap(self):
+        return False, "Не поддерживается SQLite-заменой"
+
+    def apply_mappings_delta(self, mappings, keep_real, chunk_size=None):
+        counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+        try:
+            with self._write() as conn:
+                for chunk in _chunks(mappings, chunk_size or self.chunk_size):
+                    placeholders = ", ".join("?" * len(chunk))
+                    existing = dict(conn.execute(
+                        "SELECT real_phone, fake_phone FROM phone_mappings "
+                        f"WHERE real_phone IN ({placeholders})",
+                        [real for real, _ in chunk]
+                    ).fetchall())
+                    for real_phone, fake_phone in chunk:
+                        current = existing.get(real_phone)
+                        if current == fake_phone:
+                            counts['unchanged'] += 1
+                            continue
+                        counts['added' if current is None else 'changed'] += 1
+                        conn.execute("DELETE FROM phone_mappings WHERE real_phone = ? OR fake_phone = ?",
+                                     (real_phone, fake_phone))
+                        conn.execute("INSERT INTO phone_mappings (real_phone, fake_phone) VALUES (?, ?)",
+                                     (real_phone, fake_phone))
+                removed = [
+                    (real,) for (real,) in conn.execute("SELECT real_phone FROM phone_mappings").fetchall()
+                    if not keep_real(real)
+                ]
+                conn.executemany("DELETE FROM phone_mappings WHERE real_phone = ?", removed)
+                counts['removed'] = len(removed)
+            return True, None, counts
+        except sqlite3.Error as e:
+            return False, str(e), counts
+
+    # Возобновляемый импорт
+
+    def get_import_checkpoint(self, file_name):
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT file_size, file_mtime_ns, byte_offset, last_row, rows_staged, stage "
+                "FROM import_checkpoints WHERE file_name = ?", (file_name,)
+            )
+            row = cursor.fetchone()
+            return dict(zip([d[0] for d in cursor.description], row)) if row else None
+
+    def start_import_staging(self, file_name, file_size, file_mtime_ns):
+        with self.lock:
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS phone_mappings_staging;
+                CREATE TABLE phone_mappings_staging (
+                    pos INTEGER PRIMARY KEY, real_phone TEXT NOT NULL, fake_phone TEXT NOT NULL
+                );
+                DELETE FROM import_checkpoints;
+            """)
+            self.conn.execute(
+                "INSERT INTO import_checkpoints (file_name, file_size, file_mtime_ns) VALUES (?, ?, ?)",
+                (file_name, file_size, file_mtime_ns)
+            )
+        return True, None
+
+    def stage_mappings_chunk(self, file_name, rows, byte_offset, last_row, chunk_size=None):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO phone_mappings_staging (pos, real_phone, fake_phone) VALUES (?, ?, ?)", rows
+                )
+                self.conn.execute(
+                    "UPDATE import_checkpoints SET byte_offset = ?, last_row = ?, "
+                    "rows_staged = rows_staged + ? WHERE file_name = ?",
+                    (byte_offset, last_row, len(rows), file_name)
+                )
+            except sqlite3.Error as e:
+                self.conn.execute("ROLLBACK")
+                return False, str(e)
+            self.conn.execute("COMMIT")
+        return True, None
+
+    def finish_import_staging(self, file_name):
+        with self.lock:
+            self.conn.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_real_pos ON phone_mappings_staging (real_phone, pos);
+                CREATE INDEX IF NOT EXISTS idx_fake_pos ON phone_mappings_staging (fake_phone, pos);
+            """)
+            self.conn.execute("UPDATE import_checkpoints SET stage = 'staged' WHERE file_name = ?", (file_name,))
+        return True, None
+
+    def iter_staged_survivors(self, batch_size=None):
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT s.real_phone, s.fake_phone FROM phone_mappings_staging s
+                WHERE s.pos = (SELECT MAX(r.pos) FROM phone_mappings_staging r WHERE r.real_phone = s.real_phone)
+                  AND s.pos = (SELECT MAX(f.pos) FROM phone_mappings_staging f WHERE f.fake_phone = s.fake_phone)
+                ORDER BY s.pos
+            """).fetchall()
+        yield from rows
+
+    def clear_import_checkpoint(self, file_name):
+        with self.lock:
+            self.conn.execute("DELETE FROM import_checkpoints WHERE file_name = ?", (file_name,))
+            self.conn.execute("DROP TABLE IF EXISTS phone_mappings_staging")
+        return True
+
+    def clear_all_mappings(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM phone_mappings")
+        return True
+
+    def log_call(self, fake_phone, real_phone):
+        return self.log_calls_batch([(fake_phone, real_phone, datetime.now())])
+
+    def log_calls_batch(self, events):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO call_logs (fake_phone, real_phone, call_timestamp) VALUES (?, ?, ?)",
+                [(fake, real, ts.isoformat(sep=' ')) for fake, real, ts in events]
+            )
+        return True
+
+    # Чтение
+
+    def _fetch_one(self, sql, params):
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def get_real_phone(self, fake_phone, raise_errors=False):
+        return self._fetch_one("SELECT real_phone FROM phone_mappings WHERE fake_phone = ?", (fake_phone,))
+
+    def get_fake_phone(self, real_phone):
+        return self._fetch_one("SELECT fake_phone FROM phone_mappings WHERE real_phone = ?", (real_phone,))
+
+    def _lookup_bulk(self, key_column, value_column, keys, raise_errors=False):
+        found = {}
+        with self.lock:
+            for chunk in _chunks(keys, 500):
+                placeholders = ", ".join("?" * len(chunk))
+                found.update(self.conn.execute(
+                    f"SELECT {key_column}, {value_column} FROM phone_mappings "
+                    f"WHERE {key_column} IN ({placeholders})", chunk
+                ).fetchall())
+        return found
+
+    def get_fake_phones_bulk(self, real_phones, raise_errors=False):
+        return self._lookup_bulk('real_phone', 'fake_phone', real_phones)
+
+    def get_real_phones_bulk(self, fake_phones, raise_errors=False):
+        return self._lookup_bulk('fake_phone', 'real_phone', fake_phones)
+
+    def existing_fake_phones(self, fake_phones):
+        return set(self.get_real_phones_bulk(fake_phones))
+
+    def get_all_mappings(self):
+        with self.lock:
+            cursor = self.conn.execute("SELECT * FROM phone_mappings ORDER BY created_at DESC")
+            columns = [d[0] for d in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def iter_mappings(self, columns=('real_phone', 'fake_phone'), order_by=None, batch_size=None):
+        sql = f"SELECT {', '.join(columns)} FROM phone_mappings"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        with self.lock:
+            rows = self.conn.execute(sql).fetchall()
+        yield from rows
+
+    def get_mappings_page(self, limit, after=None, real_prefix=None, fake_prefix=None):
+        conditions, params = [], []
+        if after is not None:
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend((after[0], after[0], after[1]))
+        for column, prefix in (('real_phone', real_prefix), ('fake_phone', fake_prefix)):
+            if prefix:
+                conditions.append(f"substr({column}, 1, ?) = ?")
+                params.extend((len(prefix), prefix))
+        sql = "SELECT id, real_phone, fake_phone, created_at FROM phone_mappings"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self.lock:
+            cursor = self.conn.execute(sql, params + [limit + 1])
+            columns = [d[0] for d in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]['created_at'], rows[-1]['id'])
+
+    def estimate_mappings_count(self):
+        return self.count()
+
+    def count(self):
+        return self._fetch_one("SELECT COUNT(*) FROM phone_mappings", ())
+
+
+def install_in_routes(routes, db):
+    """Подменить БД во всех объектах app.routes, созданных при импорте"""
+    routes.db = db
+    routes.call_log_writer.db = db
+    routes.fake_allocator.db = db
+    routes.upload_jobs.db = db
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,6 +19,13 @@ class Config:
     MYSQL_USER = os.getenv('MYSQL_USER', 'asterisk')
     MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', 'asterisk')
     MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'phone_proxy')
+    MYSQL_CONNECT_TIMEOUT = int(os.getenv('MYSQL_CONNECT_TIMEOUT', 5))  # seconds
+
+    # MySQL connection pool
+    MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', 10))
+    MYSQL_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', 5))  # ожидание свободного соединения, сек
+    MYSQL_POOL_PING_INTERVAL = float(os.getenv('MYSQL_POOL_PING_INTERVAL', 30))  # ping простаивавших дольше, сек
+    MYSQL_POOL_RECYCLE = int(os.getenv('MYSQL_POOL_RECYCLE', 3600))  # пересоздавать соединения старше, сек (0 — никогда)
     
     # SQLAlchemy
     SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
@@ -27,15 +35,101 @@ class Config:
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'csv'}
+    # Фоновая обработка /upload: состояние заданий в UPLOAD_FOLDER/jobs
+    UPLOAD_JOB_WORKERS = int(os.getenv('UPLOAD_JOB_WORKERS', 2))  # параллельных загрузок на процесс
+    UPLOAD_JOB_CHUNK_SIZE = int(os.getenv('UPLOAD_JOB_CHUNK_SIZE', 5000))  # строк между обновлениями прогресса
+    UPLOAD_JOB_TTL = int(os.getenv('UPLOAD_JOB_TTL', 86400))  # seconds, потом результат удаляется
+    UPLOAD_JOB_CONFLICT_RETRIES = int(os.getenv('UPLOAD_JOB_CONFLICT_RETRIES', 3))  # повторы порции при дубле номера
+    
+    # Постраничный /mappings
+    MAPPINGS_PAGE_SIZE = int(os.getenv('MAPPINGS_PAGE_SIZE', 100))
+    MAPPINGS_PAGE_MAX = int(os.getenv('MAPPINGS_PAGE_MAX', 1000))
+    
+    # Строк в одной порции потокового /export/csv
+    EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', 5000))
+    
+    # Lookup cache (fake -> real) в памяти процесса
+    LOOKUP_CACHE_SIZE = int(os.getenv('LOOKUP_CACHE_SIZE', 100000))  # 0 — кэш выключен
+    LOOKUP_CACHE_TTL = float(os.getenv('LOOKUP_CACHE_TTL', 300))  # seconds
+    LOOKUP_CACHE_NEGATIVE_TTL = float(os.getenv('LOOKUP_CACHE_NEGATIVE_TTL', 30))  # seconds
+    LOOKUP_CACHE_GENERATION_CHECK = float(os.getenv('LOOKUP_CACHE_GENERATION_CHECK', 1))  # seconds
+    
+    # Компактный индекс всех связок в памяти процесса для /lookup (app/mapping_index.py)
+    LOOKUP_INDEX_ENABLED = os.getenv('LOOKUP_INDEX_ENABLED', 'True').lower() == 'true'
+    # memory — индекс строится в каждом процессе, snapshot — общий mmap-снимок (app/snapshot.py)
+    LOOKUP_INDEX_SOURCE = os.getenv('LOOKUP_INDEX_SOURCE', 'memory')
+    # Перестройка индекса memory — после того, как поколение не менялось столько секунд
+    LOOKUP_INDEX_REBUILD_DELAY = float(os.getenv('LOOKUP_INDEX_REBUILD_DELAY', 5))
+    
+    # Снимок phone_mappings, публикуется import_worker после каждого успешного импорта
+    SNAPSHOT_PUBLISH = os.getenv('SNAPSHOT_PUBLISH', 'True').lower() == 'true'
+    SNAPSHOT_PATH = os.getenv(
+        'SNAPSHOT_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshot', 'phone_mappings.snap')
+    )
+    SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', 1))  # seconds
+    
+    # Метрики Prometheus (/metrics): воркеры gunicorn сохраняют свои значения
+    # в METRICS_DIR раз в METRICS_SHARE_INTERVAL секунд, /metrics суммирует
+    # все процессы; пустой METRICS_DIR — только метрики отвечающего процесса
+    METRICS_DIR = os.getenv(
+        'METRICS_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'metrics')
+    )
+    METRICS_SHARE_INTERVAL = float(os.getenv('METRICS_SHARE_INTERVAL', 5))  # seconds
+    
+    # Размер порции WHERE ... IN (...) при пакетном поиске номеров
+    BULK_LOOKUP_CHUNK_SIZE = int(os.getenv('BULK_LOOKUP_CHUNK_SIZE', 1000))
+    # Максимум номеров в JSON-запросе /lookup/*/batch (NDJSON не ограничен)
+    LOOKUP_BATCH_MAX = int(os.getenv('LOOKUP_BATCH_MAX', 10000))
+    
+    # Фоновая запись call_logs
+    CALL_LOG_QUEUE_SIZE = int(os.getenv('CALL_LOG_QUEUE_SIZE', 10000))
+    CALL_LOG_BATCH_SIZE = int(os.getenv('CALL_LOG_BATCH_SIZE', 500))
+    CALL_LOG_FLUSH_INTERVAL = float(os.getenv('CALL_LOG_FLUSH_INTERVAL', 1))  # seconds
+    
+    # FastAGI сервер (agi_server.py)
+    AGI_HOST = os.getenv('AGI_HOST', '127.0.0.1')
+    AGI_PORT = int(os.getenv('AGI_PORT', 4573))
+    AGI_REFRESH_INTERVAL = float(os.getenv('AGI_REFRESH_INTERVAL', 1))  # seconds, проверка поколения (устаревший индекс не отвечает)
+    AGI_DB_FALLBACK = os.getenv('AGI_DB_FALLBACK', 'True').lower() == 'true'  # промах индекса -> запрос в БД
     
     # Phone numbers
     FAKE_NUMBER_LENGTH = 15
     FAKE_NUMBER_PREFIX = '7'  # Начало номера
+    # Ключ перестановки фейковых номеров: не менять после начала выдачи
+    FAKE_NUMBER_KEY = os.getenv('FAKE_NUMBER_KEY', SECRET_KEY)
+    FAKE_ALLOCATOR_BLOCK = int(os.getenv('FAKE_ALLOCATOR_BLOCK', 1000))  # счетчиков за одно резервирование
 
     # File import worker
     INCOMING_DIR = os.getenv('INCOMING_DIR', 'data/incoming')
     ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'data/archive')
     SCAN_INTERVAL = int(os.getenv('SCAN_INTERVAL', 60))  # seconds
-    MAX_FILE_MB = int(os.getenv('MAX_FILE_MB', 16))
+    # auto — inotify с откатом на опрос, inotify, poll — только опрос раз в SCAN_INTERVAL
+    IMPORT_WATCH_MODE = os.getenv('IMPORT_WATCH_MODE', 'auto')
+    IMPORT_WATCH_DEBOUNCE = float(os.getenv('IMPORT_WATCH_DEBOUNCE', 0.3))  # seconds тишины после записи файла
+    MAX_FILE_MB = int(os.getenv('MAX_FILE_MB', 2048))
     MAX_FILE_BYTES = MAX_FILE_MB * 1024 * 1024
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 10000))  # строк в одном INSERT
+    # Предварительная проверка файла: сколько ошибочных строк собрать в отчет до остановки
+    IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 100))
+    # Файлы от IMPORT_RESUMABLE_MIN_MB импортируются через staging-таблицу с
+    # контрольной точкой каждые IMPORT_CHECKPOINT_ROWS строк и продолжаются после падения
+    IMPORT_RESUMABLE = os.getenv('IMPORT_RESUMABLE', 'True').lower() == 'true'
+    IMPORT_RESUMABLE_MIN_MB = int(os.getenv('IMPORT_RESUMABLE_MIN_MB', 64))
+    IMPORT_CHECKPOINT_ROWS = int(os.getenv('IMPORT_CHECKPOINT_ROWS', 100000))
+    # Набор частей по манифесту GGS_all_phones.manifest: процессов для разбора частей
+    IMPORT_SHARD_WORKERS = int(os.getenv('IMPORT_SHARD_WORKERS', os.cpu_count() or 1))
+    IMPORT_SHARD_WAIT = int(os.getenv('IMPORT_SHARD_WAIT', 3600))  # seconds, ожидание недостающих частей
+    # swap — загрузка в теневую таблицу и RENAME TABLE, replace — DELETE + INSERT в одной транзакции,
+    # delta — запись только разницы между файлом и текущей таблицей
+    IMPORT_MODE = os.getenv('IMPORT_MODE', 'swap')
+    IMPORT_KEEP_PREVIOUS_TABLE = os.getenv('IMPORT_KEEP_PREVIOUS_TABLE', 'True').lower() == 'true'
+
+    # Bulk loader: insert — многострочные INSERT, load_data — LOAD DATA LOCAL INFILE
+    # (при запрете LOCAL INFILE автоматически откатывается на insert)
+    BULK_LOADER = os.getenv('BULK_LOADER', 'insert')
+    IMPORT_BULK_LOADER = os.getenv('IMPORT_BULK_LOADER', BULK_LOADER)
+    UPLOAD_BULK_LOADER = os.getenv('UPLOAD_BULK_LOADER', BULK_LOADER)
+    BULK_LOAD_TMP_DIR = os.getenv('BULK_LOAD_TMP_DIR', os.path.join(tempfile.gettempdir(), 'phone_proxy_bulk'))
 
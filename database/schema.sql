@@ -31,11 +31,30 @@ CREATE TABLE IF NOT EXISTS call_logs (
     
     INDEX idx_fake_phone (fake_phone),
     INDEX idx_real_phone (real_phone),
-    INDEX idx_call_timestamp (call_timestamp),
-    
-    FOREIGN KEY (fake_phone) REFERENCES phone_mappings(fake_phone) ON DELETE CASCADE
+    INDEX idx_call_timestamp (call_timestamp)
+    -- Без FOREIGN KEY на phone_mappings: импорт подменяет таблицу через RENAME TABLE,
+    -- а каскадное удаление стирало бы историю звонков при каждой полной замене.
+    -- В существующих установках такой ключ снимает Database.create_tables().
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Логи звонков';
 
+-- Счетчик поколений маппингов (увеличивается при каждом изменении phone_mappings,
+-- по нему in-process кэши поиска понимают, что данные устарели)
+CREATE TABLE IF NOT EXISTS mapping_generation (
+    id TINYINT PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0 COMMENT 'Номер поколения данных phone_mappings'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Поколение маппингов';
+
+INSERT IGNORE INTO mapping_generation (id, generation) VALUES (1, 0);
+
+-- Счетчик выдачи фейковых номеров: номер получается из счетчика ключевой
+-- перестановкой (app/fake_allocator.py), счетчики резервируются блоками
+CREATE TABLE IF NOT EXISTS fake_allocator (
+    id TINYINT PRIMARY KEY,
+    next_counter BIGINT NOT NULL DEFAULT 0 COMMENT 'Следующий свободный счетчик'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Счетчик фейковых номеров';
+
+INSERT IGNORE INTO fake_allocator (id, next_counter) VALUES (1, 0);
+
 -- Создание пользователя для Asterisk (опционально)
 -- ВАЖНО: Измените пароль в продакшене!
 CREATE USER IF NOT EXISTS 'asterisk'@'localhost' IDENTIFIED BY 'asterisk';
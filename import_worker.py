@@ -1,16 +1,35 @@
-import csv
+import fnmatch
+import json
 import logging
+import multiprocessing
 import os
 import shutil
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from threading import Lock, Thread
 
-from flask import Flask, jsonify
-
+from flask import Flask, Response, jsonify
+from mysql.connector import Error
+
+from app import metrics
+from app.importer import (
+    MappingValidationError,
+    StagedSurvivors,
+    ValidationReport,
+    iter_chunks,
+    iter_mapping_rows,
+    iter_mapping_rows_from,
+    iter_sharded_mapping_rows,
+    prevalidate_mapping_file,
+    scan_mapping_file,
+)
 from app.models import Database
-from app.utils import normalize_phone, validate_phone
+from app.pool import get_pool
+from app.snapshot import write_snapshot
+from app.watcher import DirectoryWatcher, InotifyUnavailable
 from config import Config
 
 
@@ -18,6 +37,23 @@ BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = BASE_DIR / "logs"
 LOG_FILE = LOG_DIR / "import.log"
 TARGET_FILE_NAME = "GGS_all_phones.csv"
+# Набор из нескольких частей: манифест со списком файлов частей по порядку
+MANIFEST_FILE_NAME = "GGS_all_phones.manifest"
+SHARD_FILE_PATTERN = "GGS_all_phones_part_*.csv"
+# Отчет предварительной проверки (ошибки строк, статистика дублей) рядом с маркером
+VALIDATION_REPORT_NAME = f"{TARGET_FILE_NAME}.validation.json"
+DELTA_COUNTERS = ("added", "changed", "removed", "unchanged")
+
+
+class ImportDatabaseError(ValueError):
+    """Ошибка записи в БД, а не данных файла"""
+
+
+class ImportInterrupted(Exception):
+    """
+    Возобновляемый импорт прерван сбоем БД: staging-таблица и контрольная
+    точка сохранены, файл возвращается в очередь и импортируется дальше
+    """
 
 
 def setup_logging():
@@ -32,6 +68,34 @@ def setup_logging():
     )
 
 
+def read_manifest(path: Path):
+    """
+    Имена файлов частей из манифеста (по одному в строке, # — комментарий).
+
+    Порядок строк — порядок частей: при повторах номеров побеждает строка
+    из более поздней части, как если бы части были одним файлом.
+    """
+    names = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            name = line.strip()
+            if not name or name.startswith("#"):
+                continue
+            if Path(name).name != name or not fnmatch.fnmatchcase(name, SHARD_FILE_PATTERN):
+                raise ValueError(f"Недопустимое имя части в манифесте: {name}")
+            if name in names:
+                raise ValueError(f"Часть указана в манифесте дважды: {name}")
+            names.append(name)
+    if not names:
+        raise ValueError("Манифест не содержит частей")
+    return names
+
+
+def is_import_file(name):
+    """Файл, появление которого может запустить импорт"""
+    return name in (TARGET_FILE_NAME, MANIFEST_FILE_NAME) or fnmatch.fnmatchcase(name, SHARD_FILE_PATTERN)
+
+
 class ImportState:
     """Потокобезопасное хранение статуса последнего импорта."""
 
@@ -58,6 +122,16 @@ class ImportWorker:
         self.archive_dir = archive if archive.is_absolute() else (BASE_DIR / archive).resolve()
         self.scan_interval = Config.SCAN_INTERVAL
         self.max_file_bytes = Config.MAX_FILE_BYTES
+        self.import_mode = Config.IMPORT_MODE
+        self.bulk_loader = Config.IMPORT_BULK_LOADER
+        self.shard_workers = Config.IMPORT_SHARD_WORKERS
+        self.shard_wait = Config.IMPORT_SHARD_WAIT
+        self.watch_mode = Config.IMPORT_WATCH_MODE
+        self.watch_debounce = Config.IMPORT_WATCH_DEBOUNCE
+        self.resumable = Config.IMPORT_RESUMABLE
+        self.resumable_min_bytes = Config.IMPORT_RESUMABLE_MIN_MB * 1024 * 1024
+        self.checkpoint_rows = Config.IMPORT_CHECKPOINT_ROWS
+        self.max_errors = Config.IMPORT_MAX_ERRORS
 
         self.incoming_dir.mkdir(parents=True, exist_ok=True)
         self.archive_dir.mkdir(parents=True, exist_ok=True)
@@ -66,47 +140,204 @@ class ImportWorker:
         self.db.create_tables()
 
     def run_forever(self):
+        try:
+            self.recover_orphans()
+        except Exception as e:
+            logging.exception(f"Ошибка восстановления прерванных импортов: {e}")
+
+        watcher = self.create_watcher()
         while True:
             try:
-                self.scan_once()
+                self.scan_once(watcher.writing if watcher is not None else ())
             except Exception as e:
                 logging.exception(f"Необработанная ошибка цикла: {e}")
+
+            if watcher is not None:
+                # Просыпаемся по событию inotify, но не реже SCAN_INTERVAL:
+                # периодическая проверка нужна для таймаута частей набора
+                try:
+                    watcher.wait(self.scan_interval)
+                    continue
+                except OSError as e:
+                    logging.error(f"Ошибка inotify, переход на опрос каталога: {e}")
+                    watcher.close()
+                    watcher = None
             time.sleep(self.scan_interval)
 
-    def scan_once(self):
+    def create_watcher(self):
+        """
+        Наблюдение за INCOMING_DIR согласно IMPORT_WATCH_MODE.
+
+        auto и inotify — события inotify, при недоступности inotify —
+        опрос каталога раз в SCAN_INTERVAL (как в режиме poll).
+        """
+        if self.watch_mode == "poll":
+            return None
+        try:
+            watcher = DirectoryWatcher(self.incoming_dir, is_import_file, self.watch_debounce)
+        except InotifyUnavailable as e:
+            log = logging.error if self.watch_mode == "inotify" else logging.warning
+            log(f"inotify недоступен ({e}), опрос каталога раз в {self.scan_interval}с")
+            return None
+        logging.info(f"Наблюдение за {self.incoming_dir} через inotify")
+        return watcher
+
+    def scan_once(self, writing=()):
+        """
+        Запустить импорт, если во входящем каталоге есть файл или набор частей.
+
+        Args:
+            writing: имена файлов, в которые еще пишут (DirectoryWatcher.writing);
+                такие файлы ждут следующего сканирования
+        """
+        manifest = self.incoming_dir / MANIFEST_FILE_NAME
+        if manifest.exists():
+            self.scan_manifest(manifest, writing)
+            return
+
         target = self.incoming_dir / TARGET_FILE_NAME
-        if not target.exists():
+        if not target.exists() or TARGET_FILE_NAME in writing:
             return
 
-        processing_path = target.with_suffix(target.suffix + ".processing")
+        self.run_import(TARGET_FILE_NAME, [target], lambda paths: self.import_file(paths[0]))
+
+    def recover_orphans(self):
+        """
+        Разобрать файлы .processing, оставшиеся после остановки посреди импорта.
+
+        Файл с контрольной точкой в БД импортируется дальше с последней
+        записанной порции. Остальные (в том числе части набора) возвращаются
+        под исходным именем и импортируются заново обычным сканированием;
+        если за это время пришла новая версия файла, старая уходит в архив.
+        """
+        for processing_path in sorted(self.incoming_dir.glob("*.processing")):
+            original = processing_path.with_name(processing_path.name[:-len(".processing")])
+
+            if original.name == TARGET_FILE_NAME and not original.exists() \
+                    and self.db.get_import_checkpoint(processing_path.name):
+                logging.warning(f"Продолжение прерванного импорта {original.name}")
+                self.run_import(
+                    TARGET_FILE_NAME, [original],
+                    lambda paths: self.process_file_resumable(paths[0]),
+                    claimed=True
+                )
+                continue
+
+            if original.exists():
+                archive_name = (
+                    f"{original.stem}_orphan_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+                    f"{original.suffix}"
+                )
+                shutil.move(processing_path, self.archive_dir / archive_name)
+                logging.warning(
+                    f"Прерванный импорт {original.name} заменен новым файлом, старый в архиве: {archive_name}"
+                )
+            else:
+                processing_path.rename(original)
+                logging.warning(f"Файл {original.name} после прерванного импорта возвращен в очередь")
+
+    def scan_manifest(self, manifest: Path, writing=()):
+        """
+        Импортировать набор частей из манифеста, когда все части на месте.
+
+        Upstream кладет манифест последним; пока каких-то частей нет, набор
+        ждет до IMPORT_SHARD_WAIT секунд с момента появления манифеста,
+        после этого импорт завершается ошибкой.
+        """
+        if MANIFEST_FILE_NAME in writing:
+            return
         try:
-            target.rename(processing_path)
-        except FileNotFoundError:
+            names = read_manifest(manifest)
+            manifest_error = None
+        except (OSError, ValueError) as e:
+            names, manifest_error = [], f"Некорректный манифест: {e}"
+
+        if any(name in writing for name in names):
             return
 
+        missing = [name for name in names if not (self.incoming_dir / name).exists()]
+        if missing and manifest_error is None:
+            try:
+                age = time.time() - manifest.stat().st_mtime
+            except FileNotFoundError:
+                return
+            if age < self.shard_wait:
+                return
+            manifest_error = f"Не найдены части набора: {', '.join(missing)}"
+
+        shards = [self.incoming_dir / name for name in names if name not in missing]
+
+        def process(paths):
+            if manifest_error:
+                raise ValueError(manifest_error)
+            return self.process_shards(paths[1:])
+
+        self.run_import(
+            MANIFEST_FILE_NAME, [manifest] + shards, process,
+            report={"shards": [{"file": name} for name in names]}
+        )
+
+    def run_import(self, name, paths, process, report=None, claimed=False):
+        """
+        Общий цикл импорта: забрать файлы, обработать, записать маркер, архивировать.
+
+        Args:
+            name: имя файла (или манифеста) для отчета
+            paths: входные файлы; переименовываются в .processing, чтобы
+                повторное сканирование их не подхватило
+            process: функция(список путей .processing) -> dict результата
+            report: начальные поля отчета (состав набора для маркера)
+            claimed: файлы уже переименованы (продолжение прерванного импорта)
+        """
+        processing_paths = []
+        for path in paths:
+            processing_path = path.with_suffix(path.suffix + ".processing")
+            if claimed:
+                processing_paths.append(processing_path)
+                continue
+            try:
+                path.rename(processing_path)
+            except FileNotFoundError:
+                # Файл забрали или удалили — возвращаем уже переименованные
+                for original, renamed in zip(paths, processing_paths):
+                    renamed.rename(original)
+                return
+            processing_paths.append(processing_path)
+
         started_at = datetime.utcnow()
         status_report = {
-            "file": TARGET_FILE_NAME,
+            "file": name,
             "started_at": started_at.isoformat() + "Z",
         }
+        status_report.update(report or {})
 
+        interrupted = False
         try:
-            insert_count, total_rows = self.process_file(processing_path)
+            result = process(processing_paths)
             finished_at = datetime.utcnow()
             duration = (finished_at - started_at).total_seconds()
+            status_report.update(result)
             status_report.update(
                 {
                     "success": True,
-                    "inserted": insert_count,
-                    "total_rows": total_rows,
                     "duration_sec": duration,
                     "finished_at": finished_at.isoformat() + "Z",
                 }
             )
+            if Config.SNAPSHOT_PUBLISH:
+                with metrics.IMPORT_PHASE_SECONDS.labels("snapshot").time():
+                    status_report.update(self.publish_snapshot())
             self.write_marker(True, status_report)
+            metrics.IMPORTS.labels("success").inc()
+            metrics.IMPORT_LAST_SUCCESS.set(time.time())
             logging.info(
-                f"Импорт завершен: inserted={insert_count}, total={total_rows}, "
-                f"duration={duration:.2f}s"
+                f"Импорт {name} завершен ({result['mode']}): inserted={result['inserted']}, "
+                f"total={result['total_rows']}"
+                + "".join(
+                    f", {key}={result[key]}"
+                    for key in DELTA_COUNTERS if key in result
+                )
+                + f", duration={duration:.2f}s"
             )
         except Exception as e:
             finished_at = datetime.utcnow()
@@ -119,86 +350,328 @@ class ImportWorker:
                     "finished_at": finished_at.isoformat() + "Z",
                 }
             )
-            self.write_marker(False, status_report)
-            logging.error(f"Импорт завершился с ошибкой: {e}")
+            metrics.IMPORTS.labels("failure").inc()
+            if isinstance(e, ImportInterrupted):
+                interrupted = True
+                status_report["interrupted"] = True
+                logging.error(f"Импорт {name} прерван сбоем БД, продолжится при следующем сканировании: {e}")
+            else:
+                if isinstance(e, MappingValidationError):
+                    status_report["error_rows"] = e.report.error_count
+                    status_report["validation_report"] = VALIDATION_REPORT_NAME
+                self.write_marker(False, status_report)
+                logging.error(f"Импорт {name} завершился с ошибкой: {e}")
+
+        if interrupted:
+            # Файл возвращается в очередь под исходным именем: контрольная
+            # точка привязана к размеру и mtime, rename их не меняет
+            for path, processing_path in zip(paths, processing_paths):
+                if path.exists():
+                    # Пришла новая версия файла — она заменит прерванный импорт
+                    continue
+                try:
+                    processing_path.rename(path)
+                except OSError as rename_error:
+                    logging.error(f"Не удалось вернуть файл {path.name} в очередь: {rename_error}")
+            self.state.set(status_report)
+            return
 
-        # Архивируем исходный файл вне зависимости от результата
-        archive_name = (
-            f"{Path(TARGET_FILE_NAME).stem}_{finished_at.strftime('%Y%m%d_%H%M%S')}"
-            f"{Path(TARGET_FILE_NAME).suffix}"
-        )
-        archive_path = self.archive_dir / archive_name
-        try:
-            shutil.move(processing_path, archive_path)
-        except Exception as move_error:
-            logging.error(f"Не удалось переместить файл в архив: {move_error}")
+        # Архивируем исходные файлы вне зависимости от результата
+        for path, processing_path in zip(paths, processing_paths):
+            archive_name = (
+                f"{path.stem}_{finished_at.strftime('%Y%m%d_%H%M%S')}{path.suffix}"
+            )
+            try:
+                shutil.move(processing_path, self.archive_dir / archive_name)
+            except Exception as move_error:
+                logging.error(f"Не удалось переместить файл {path.name} в архив: {move_error}")
 
         self.state.set(status_report)
 
-    def process_file(self, path: Path):
-        """Прочитать CSV, валидировать и заменить данные в БД."""
+    def publish_snapshot(self):
+        """
+        Опубликовать mmap-снимок phone_mappings для процессов Flask.
+
+        Ошибка снимка не отменяет импорт: данные уже в БД, а читатели
+        снимка сами переключатся на MySQL по несовпадению поколения.
+        """
+        try:
+            # Поколение читается до чтения таблицы: если таблицу изменят
+            # во время записи снимка, он просто окажется устаревшим
+            generation = self.db.get_generation()
+            if generation is None:
+                raise RuntimeError("Не удалось прочитать поколение маппингов")
+            info = write_snapshot(Config.SNAPSHOT_PATH, self.db.iter_mappings(), generation)
+            logging.info(
+                f"Снимок опубликован: {Config.SNAPSHOT_PATH}, связок={info['entries']}, "
+                f"поколение={info['generation']}"
+            )
+            return {"snapshot": info}
+        except Exception as e:
+            logging.error(f"Не удалось опубликовать снимок: {e}")
+            return {"snapshot_error": str(e)}
+
+    def check_file(self, path: Path):
         if not path.exists():
             raise FileNotFoundError(f"Файл не найден: {path}")
 
         size_bytes = path.stat().st_size
         if size_bytes > self.max_file_bytes:
             raise ValueError(
-                f"Файл слишком большой: {size_bytes} байт > {self.max_file_bytes}"
+                f"Файл {path.name} слишком большой: {size_bytes} байт > {self.max_file_bytes}"
             )
 
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.reader(f, delimiter=";")
-            rows = list(reader)
-
-        if not rows:
-            raise ValueError("Файл пуст")
-
-        # Пропускаем заголовок
-        data_rows = rows[1:]
-        if not data_rows:
-            raise ValueError("Нет данных после заголовка")
-
-        mappings_map = {}          # real_phone -> fake_phone (последнее значение)
-        reverse_map = {}           # fake_phone -> real_phone (для поддержания уникальности)
-
-        for idx, row in enumerate(data_rows, start=2):  # старт с 2 из-за заголовка
-            if len(row) < 2:
-                raise ValueError(f"Недостаточно колонок в строке {idx}")
-
-            raw_real, raw_fake = row[0].strip(), row[1].strip()
-            if not raw_real or not raw_fake:
-                raise ValueError(f"Пустое значение в строке {idx}")
-
-            real_phone = normalize_phone(raw_real)
-            fake_phone = raw_fake  # фейковый может быть буквенно-цифровым хэшем
+    def import_file(self, path: Path):
+        """
+        Проверить файл и импортировать: большие файлы — с контрольными
+        точками, остальные — в памяти
+        """
+        self.check_file(path)
+        report = self.prevalidate(TARGET_FILE_NAME, [path])
+        if self.resumable and path.stat().st_size >= self.resumable_min_bytes:
+            result = self.process_file_resumable(path)
+        else:
+            result = self.process_file(path)
+        result["validation_report"] = VALIDATION_REPORT_NAME
+        result["duplicates"] = report.as_dict().get("duplicates")
+        return result
+
+    def prevalidate(self, name, paths):
+        """
+        Предварительная проверка файлов импорта до обращений к БД.
+
+        Ошибки собираются до IMPORT_MAX_ERRORS (по всем частям набора), отчет
+        пишется в VALIDATION_REPORT_NAME в каталоге входящих файлов. Части
+        набора проверяются параллельно, статистика дублей считается только
+        для одного файла.
+
+        Raises:
+            MappingValidationError: в файле есть ошибочные строки
+        """
+        with metrics.IMPORT_PHASE_SECONDS.labels("prevalidate").time():
+            if len(paths) == 1:
+                report = prevalidate_mapping_file(paths[0], self.max_errors)
+            else:
+                report = ValidationReport(self.max_errors)
+                with self.shard_executor(len(paths)) as executor:
+                    futures = [
+                        executor.submit(
+                            prevalidate_mapping_file, str(path), self.max_errors,
+                            False, self.shard_name(path)
+                        )
+                        for path in paths
+                    ]
+                    for path, future in zip(paths, futures):
+                        try:
+                            report.merge(future.result())
+                        except ValueError as e:
+                            raise ValueError(f"{self.shard_name(path)}: {e}") from e
+
+        self.write_validation_report(name, report)
+        if report.error_count:
+            first = report.errors[0]
+            raise MappingValidationError(
+                f"Ошибочных строк: {report.error_count}"
+                + ("+ (проверка остановлена на лимите)" if report.truncated else "")
+                + f", первая: {first.get('file', name)}: {first['error']}",
+                report
+            )
+        return report
+
+    def shard_executor(self, count):
+        # spawn: в процессе воркера работают потоки (статус-сервер),
+        # fork с ними небезопасен
+        return ProcessPoolExecutor(
+            max_workers=max(1, min(self.shard_workers, count)),
+            mp_context=multiprocessing.get_context("spawn")
+        )
 
-            if not validate_phone(real_phone):
-                raise ValueError(f"Невалидный real_phone в строке {idx}: {raw_real}")
+    def write_validation_report(self, name, report):
+        path = self.incoming_dir / VALIDATION_REPORT_NAME
+        data = {"file": name, "checked_at": datetime.utcnow().isoformat() + "Z"}
+        data.update(report.as_dict())
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logging.error(f"Не удалось записать отчет проверки {path}: {e}")
 
-            # Лёгкая валидация для fake: непустой, разумная длина
-            if len(fake_phone) < 3 or len(fake_phone) > 64:
-                raise ValueError(f"Невалидный fake_phone в строке {idx}: {raw_fake}")
+    def process_file(self, path: Path):
+        """Потоково прочитать CSV, валидировать и заменить данные в БД."""
+        self.check_file(path)
 
-            # Если real уже был — убираем старую связь fake->real
-            if real_phone in mappings_map:
-                old_fake = mappings_map[real_phone]
-                reverse_map.pop(old_fake, None)
+        # Первый проход: потоковая валидация и запоминание последних вхождений
+        with metrics.IMPORT_PHASE_SECONDS.labels("parse_validate").time():
+            deduper = scan_mapping_file(path)
+        metrics.IMPORT_ROWS.inc(deduper.total_rows)
 
-            # Если fake уже был на другой real — убираем ту связь
-            if fake_phone in reverse_map:
-                old_real = reverse_map[fake_phone]
-                mappings_map.pop(old_real, None)
+        if not deduper.total_rows:
+            raise ValueError("Нет данных после заголовка")
 
-            mappings_map[real_phone] = fake_phone
-            reverse_map[fake_phone] = real_phone
+        # Второй проход: выжившие маппинги порциями уходят прямо в БД
+        mappings = deduper.survivors(iter_mapping_rows(path))
+
+        with metrics.IMPORT_PHASE_SECONDS.labels("db_write").time():
+            result = self.write_mappings(mappings, deduper)
+        result["total_rows"] = deduper.total_rows
+        return result
+
+    def process_file_resumable(self, path: Path):
+        """
+        Импорт файла через staging-таблицу с контрольными точками.
+
+        Провалидированные строки пишутся в staging порциями по
+        IMPORT_CHECKPOINT_ROWS; вместе с каждой порцией в той же транзакции
+        сохраняются номер строки и смещение в байтах. После падения процесса
+        чтение продолжается с этого смещения, теряется только незаписанная
+        порция. Дубли разрешаются в SQL (iter_staged_survivors), итог
+        записывается в phone_mappings обычным write_mappings.
+        """
+        self.check_file(path)
+        stat = path.stat()
+        checkpoint = self.db.get_import_checkpoint(path.name)
+        if checkpoint and (checkpoint["file_size"], checkpoint["file_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            logging.info(
+                f"Импорт {path.name} продолжается после строки {checkpoint['last_row']} "
+                f"(байт {checkpoint['byte_offset']}, уже записано {checkpoint['rows_staged']})"
+            )
+        else:
+            success, error = self.db.start_import_staging(path.name, stat.st_size, stat.st_mtime_ns)
+            if not success:
+                raise ValueError(f"Ошибка записи в БД: {error}")
+            checkpoint = {"byte_offset": 0, "last_row": 1, "rows_staged": 0, "stage": "staging"}
 
-        mappings = list(mappings_map.items())
+        try:
+            total_rows = checkpoint["rows_staged"]
+            if checkpoint["stage"] == "staging":
+                rows = iter_mapping_rows_from(
+                    path, checkpoint["byte_offset"], checkpoint["last_row"] + 1
+                )
+                with metrics.IMPORT_PHASE_SECONDS.labels("parse_validate").time():
+                    for chunk in iter_chunks(rows, self.checkpoint_rows):
+                        last_row, _, _, byte_offset = chunk[-1]
+                        success, error = self.db.stage_mappings_chunk(
+                            path.name,
+                            [(idx, real_phone, fake_phone) for idx, real_phone, fake_phone, _ in chunk],
+                            byte_offset,
+                            last_row
+                        )
+                        if not success:
+                            raise ImportDatabaseError(f"Ошибка записи в БД: {error}")
+                        total_rows += len(chunk)
+                    success, error = self.db.finish_import_staging(path.name)
+                    if not success:
+                        raise ImportDatabaseError(f"Ошибка записи в БД: {error}")
+            metrics.IMPORT_ROWS.inc(total_rows - checkpoint["rows_staged"])
+
+            if not total_rows:
+                raise ValueError("Нет данных после заголовка")
+
+            mappings = StagedSurvivors(
+                self.db.iter_staged_survivors(), track_real=self.import_mode == "delta"
+            )
+            with metrics.IMPORT_PHASE_SECONDS.labels("db_write").time():
+                result = self.write_mappings(mappings, mappings)
+        except (ImportDatabaseError, Error) as e:
+            # Сбой БД (разрыв соединения, рестарт MySQL): записанные порции
+            # и контрольная точка остаются, импорт продолжится с них
+            raise ImportInterrupted(str(e)) from e
+        except Exception:
+            # Ошибка в данных файла — окончательная (файл уходит в архив с .fail)
+            self.db.clear_import_checkpoint(path.name)
+            raise
+
+        self.db.clear_import_checkpoint(path.name)
+        result["total_rows"] = total_rows
+        result["resumed_from_row"] = checkpoint["last_row"] if checkpoint["rows_staged"] else None
+        return result
+
+    def process_shards(self, paths):
+        """
+        Импортировать набор частей как один файл одной заменой данных в БД.
+
+        Первый проход (валидация и последние вхождения номеров) по частям
+        идет параллельно в пуле процессов IMPORT_SHARD_WORKERS; результаты
+        сливаются по порядку частей, поэтому правила уникальности real/fake
+        те же, что для одного файла. Второй проход — последовательно по
+        частям в одну запись write_mappings.
+        """
+        for path in paths:
+            self.check_file(path)
+        self.prevalidate(MANIFEST_FILE_NAME, paths)
+
+        shard_rows = []
+        with metrics.IMPORT_PHASE_SECONDS.labels("parse_validate").time():
+            executor = self.shard_executor(len(paths))
+            try:
+                futures = [
+                    executor.submit(scan_mapping_file, str(path), shard)
+                    for shard, path in enumerate(paths)
+                ]
+                deduper = None
+                for path, future in zip(paths, futures):
+                    try:
+                        shard_deduper = future.result()
+                    except ValueError as e:
+                        raise ValueError(f"{self.shard_name(path)}: {e}") from e
+                    shard_rows.append(shard_deduper.total_rows)
+                    if deduper is None:
+                        deduper = shard_deduper
+                    else:
+                        deduper.merge(shard_deduper)
+            finally:
+                executor.shutdown(cancel_futures=True)
+        metrics.IMPORT_ROWS.inc(deduper.total_rows)
+
+        if not deduper.total_rows:
+            raise ValueError("Нет данных после заголовка ни в одной части")
+
+        mappings = deduper.survivors(iter_sharded_mapping_rows(paths))
+
+        with metrics.IMPORT_PHASE_SECONDS.labels("db_write").time():
+            result = self.write_mappings(mappings, deduper)
+        result["total_rows"] = deduper.total_rows
+        result["validation_report"] = VALIDATION_REPORT_NAME
+        result["shards"] = [
+            {"file": self.shard_name(path), "rows": rows}
+            for path, rows in zip(paths, shard_rows)
+        ]
+        return result
+
+    @staticmethod
+    def shard_name(path: Path):
+        """Имя части без суффикса .processing"""
+        return path.name[:-len(".processing")] if path.name.endswith(".processing") else path.name
+
+    def write_mappings(self, mappings, deduper):
+        """
+        Записать маппинги в БД согласно IMPORT_MODE.
+
+        Returns:
+            dict: mode, inserted и (для delta) added/changed/removed/unchanged
+        """
+        mode = self.import_mode
+        if mode == "delta":
+            success, error, counts = self.db.apply_mappings_delta(
+                mappings, deduper.has_real
+            )
+            result = dict(counts, inserted=counts["added"] + counts["changed"])
+        else:
+            if mode == "swap":
+                success, error, inserted = self.db.swap_replace_mappings(
+                    mappings, loader=self.bulk_loader
+                )
+            else:
+                success, error, inserted = self.db.replace_all_mappings(
+                    mappings, loader=self.bulk_loader
+                )
+            result = {"inserted": inserted}
 
-        success, error, inserted = self.db.replace_all_mappings(mappings)
         if not success:
-            raise ValueError(f"Ошибка записи в БД: {error}")
+            raise ImportDatabaseError(f"Ошибка записи в БД: {error}")
 
-        return inserted, len(data_rows)
+        result["mode"] = mode
+        return result
 
     def write_marker(self, success: bool, report: dict):
         """Записать файл результата .OK или .fail рядом с входным файлом."""
@@ -214,10 +687,36 @@ class ImportWorker:
         ]
 
         if success:
+            lines.append(f"mode={report.get('mode')}")
             lines.append(f"total_rows={report.get('total_rows')}")
             lines.append(f"inserted={report.get('inserted')}")
+            if report.get("resumed_from_row"):
+                lines.append(f"resumed_from_row={report['resumed_from_row']}")
+            if report.get("duplicates"):
+                for key, value in report["duplicates"].items():
+                    lines.append(f"{key}={value}")
+            for key in DELTA_COUNTERS:
+                if key in report:
+                    lines.append(f"{key}={report[key]}")
+            if "snapshot" in report:
+                lines.append(f"snapshot_generation={report['snapshot']['generation']}")
+            elif "snapshot_error" in report:
+                lines.append(f"snapshot_error={report['snapshot_error']}")
         else:
             lines.append(f"error={report.get('error')}")
+            if "error_rows" in report:
+                lines.append(f"error_rows={report['error_rows']}")
+
+        if "validation_report" in report:
+            lines.append(f"validation_report={report['validation_report']}")
+
+        # Состав набора частей (импорт по манифесту)
+        if "shards" in report:
+            lines.append(f"shards={len(report['shards'])}")
+            for number, shard in enumerate(report["shards"], start=1):
+                lines.append(f"shard_{number}={shard['file']}")
+                if "rows" in shard:
+                    lines.append(f"shard_{number}_rows={shard['rows']}")
 
         try:
             with open(marker_path, "w", encoding="utf-8") as f:
@@ -228,10 +727,11 @@ class ImportWorker:
 
 def create_status_app(state: ImportState):
     app = Flask(__name__)
+    metrics.instrument_app(app)
 
     @app.route("/health")
     def health():
-        return jsonify({"status": "ok"}), 200
+        return jsonify({"status": "ok", "pool": get_pool().stats()}), 200
 
     @app.route("/status")
     def status():
@@ -240,10 +740,28 @@ def create_status_app(state: ImportState):
             return jsonify({"status": "idle"}), 200
         return jsonify({"status": "ok", "last_run": snap}), 200
 
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
     return app
 
 
+def rollback():
+    """Вернуть маппинги, действовавшие до последнего импорта (режим swap)."""
+    setup_logging()
+    success, error = Database().rollback_mappings_swap()
+    if success:
+        logging.info("Маппинги возвращены к предыдущему импорту")
+    else:
+        logging.error(f"Не удалось откатить импорт: {error}")
+    return 0 if success else 1
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        sys.exit(rollback())
+
     setup_logging()
     state = ImportState()
     worker = ImportWorker(state)
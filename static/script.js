@@ -1,5 +1,13 @@
-// Глобальная переменная для хранения результатов
-let currentResults = [];
+// Задание последней загрузки (результат скачивается с сервера)
+let currentJobId = null;
+
+// Интервал опроса статуса задания
+const JOB_POLL_INTERVAL = 1000;
+
+// Постраничный список текущих номеров: курсор следующей страницы и фильтры
+let listCursor = null;
+let listFilters = {};
+let listLoaded = 0;
 
 // Обработка загрузки формы
 document.getElementById('uploadForm').addEventListener('submit', async (e) => {
@@ -34,26 +42,78 @@ document.getElementById('uploadForm').addEventListener('submit', async (e) => {
         
         const data = await response.json();
         
-        if (response.ok && data.success) {
-            currentResults = data.mappings;
+        if (!response.ok || !data.success) {
+            showError(data.error || 'Ошибка при обработке файла');
+            return;
+        }
+        
+        fileInput.value = ''; // Очистка input
+        
+        // Файл обрабатывается в фоне — ждем завершения задания
+        const job = await waitForJob(data.job_id);
+        
+        if (job.status === 'done') {
+            currentJobId = job.id;
             
             // Показываем кнопку скачать
             document.getElementById('downloadSection').style.display = 'block';
             
-            // Показываем список
-            displayList(data.mappings);
-            
-            fileInput.value = ''; // Очистка input
+            // Показываем первые связки из результата
+            const preview = await fetch(`/jobs/${job.id}/result?format=json`);
+            const previewData = await preview.json();
+            if (preview.ok && previewData.success) {
+                document.getElementById('searchForm').style.display = 'none';
+                displayList(previewData.mappings, previewData.total);
+            }
         } else {
-            showError(data.error || 'Ошибка при обработке файла');
+            showError(job.error || 'Ошибка при обработке файла');
         }
     } catch (error) {
         showError('Ошибка соединения с сервером: ' + error.message);
     } finally {
         document.getElementById('loading').style.display = 'none';
+        document.getElementById('loadingText').textContent = 'Обработка...';
     }
 });
 
+// Опрос статуса задания до завершения с выводом прогресса
+async function waitForJob(jobId) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            return { status: 'failed', error: job.error };
+        }
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        
+        document.getElementById('loadingText').textContent = formatProgress(job);
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+}
+
+// Текст прогресса: строки, скорость и оставшееся время
+function formatProgress(job) {
+    if (job.status === 'queued') {
+        return 'В очереди...';
+    }
+    if (!job.rows_total) {
+        return 'Чтение файла...';
+    }
+    
+    const percent = Math.floor(job.rows_done * 100 / job.rows_total);
+    let text = `Обработано ${job.rows_done} из ${job.rows_total} (${percent}%)`;
+    if (job.throughput_rows_sec) {
+        text += `, ${Math.round(job.throughput_rows_sec)} строк/с`;
+    }
+    if (job.eta_sec != null) {
+        text += `, осталось ~${Math.ceil(job.eta_sec)} с`;
+    }
+    return text;
+}
+
 // Обновление текста при выборе файла
 document.getElementById('fileInput').addEventListener('change', (e) => {
     const fileName = e.target.files[0]?.name;
@@ -63,11 +123,20 @@ document.getElementById('fileInput').addEventListener('change', (e) => {
 });
 
 // Отображение списка номеров
-function displayList(mappings) {
-    const tbody = document.getElementById('phoneListBody');
-    tbody.innerHTML = '';
+function displayList(mappings, total = mappings.length) {
+    document.getElementById('phoneListBody').innerHTML = '';
+    document.getElementById('phoneCount').textContent = total;
+    document.getElementById('loadMoreButton').style.display = 'none';
     
-    document.getElementById('phoneCount').textContent = mappings.length;
+    appendRows(mappings);
+    
+    document.getElementById('listSection').style.display = 'block';
+}
+
+// Добавление строк в конец таблицы
+function appendRows(mappings) {
+    const tbody = document.getElementById('phoneListBody');
+    const fragment = document.createDocumentFragment();
     
     mappings.forEach((mapping) => {
         const row = document.createElement('tr');
@@ -75,41 +144,83 @@ function displayList(mappings) {
             <td>${mapping.real_phone}</td>
             <td><strong>${mapping.fake_phone}</strong></td>
         `;
-        tbody.appendChild(row);
+        fragment.appendChild(row);
     });
     
-    document.getElementById('listSection').style.display = 'block';
+    tbody.appendChild(fragment);
 }
 
 // Скачать результаты (только фейковые номера)
 function downloadResults() {
-    if (currentResults.length === 0) {
+    if (!currentJobId) {
         showError('Нет данных для скачивания');
         return;
     }
     
-    // Только фейковые номера построчно, без заголовков
-    let content = currentResults.map(m => m.fake_phone).join('\n');
-    
-    downloadCSV(content, 'fake_phones.txt');
+    // Только фейковые номера построчно, без заголовков (файл отдает сервер)
+    window.location.href = `/jobs/${currentJobId}/result?format=fake`;
 }
 
 // Показать текущие номера
 async function showCurrentNumbers() {
+    listFilters = {};
+    document.getElementById('searchReal').value = '';
+    document.getElementById('searchFake').value = '';
+    await loadMappingsPage(true);
+}
+
+// Поиск по началу реального или фейкового номера
+document.getElementById('searchForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    
+    listFilters = {};
+    const real = document.getElementById('searchReal').value.trim();
+    const fake = document.getElementById('searchFake').value.trim();
+    if (real) listFilters.real = real;
+    if (fake) listFilters.fake = fake;
+    
+    await loadMappingsPage(true);
+});
+
+// Загрузка страницы номеров: reset — с начала списка, иначе следующая страница
+async function loadMappingsPage(reset) {
+    const params = new URLSearchParams(listFilters);
+    if (!reset && listCursor) {
+        params.set('cursor', listCursor);
+    }
+    
     try {
-        const response = await fetch('/mappings');
+        const response = await fetch('/mappings?' + params.toString());
         const data = await response.json();
         
-        if (response.ok && data.success) {
-            if (data.mappings.length === 0) {
+        if (!response.ok || !data.success) {
+            showError(data.error || 'Ошибка при загрузке данных');
+            return;
+        }
+        
+        if (reset) {
+            if (data.mappings.length === 0 && Object.keys(listFilters).length === 0) {
                 showError('Нет сохраненных номеров');
                 return;
             }
-            
+            listLoaded = 0;
             displayList(data.mappings);
+            document.getElementById('searchForm').style.display = 'flex';
         } else {
-            showError(data.error || 'Ошибка при загрузке данных');
+            appendRows(data.mappings);
         }
+        
+        listLoaded += data.mappings.length;
+        listCursor = data.next_cursor;
+        
+        // Для полного списка — оценка общего числа, для поиска — сколько загружено
+        if (reset && data.total_estimate != null) {
+            document.getElementById('phoneCount').textContent = '≈' + data.total_estimate;
+        } else if (Object.keys(listFilters).length > 0) {
+            document.getElementById('phoneCount').textContent = listLoaded + (listCursor ? '+' : '');
+        }
+        
+        document.getElementById('loadMoreButton').style.display = listCursor ? 'inline-block' : 'none';
     } catch (error) {
         showError('Ошибка соединения с сервером: ' + error.message);
     }
@@ -132,7 +243,7 @@ async function clearAllNumbers() {
             // Скрыть список и кнопку скачать
             document.getElementById('listSection').style.display = 'none';
             document.getElementById('downloadSection').style.display = 'none';
-            currentResults = [];
+            currentJobId = null;
             
             alert('Все номера успешно удалены!');
         } else {
@@ -143,21 +254,6 @@ async function clearAllNumbers() {
     }
 }
 
-// Скачивание CSV
-function downloadCSV(content, filename) {
-    const blob = new Blob([content], { type: 'text/csv;charset=utf-8;' });
-    const link = document.createElement('a');
-    const url = URL.createObjectURL(blob);
-    
-    link.setAttribute('href', url);
-    link.setAttribute('download', filename);
-    link.style.visibility = 'hidden';
-    
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
-}
-
 // Показ ошибки
 function showError(message) {
     const errorDiv = document.getElementById('error');